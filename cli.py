@@ -8,7 +8,6 @@ Vessel Tool 命令行接口
 import argparse
 import json
 import sys
-import os
 from vessel_tool import VesselProcessor
 
 
@@ -22,6 +21,7 @@ def main():
   %(prog)s -d /path/to/dicom -s /path/to/segmentation.nrrd -o /path/to/output
   %(prog)s -c config.json
   %(prog)s --batch batch_config.json
+  %(prog)s --batch batch_config.json --workers 4
         """
     )
     
@@ -48,6 +48,10 @@ def main():
                        help='血管最大半径（默认: 10.0）')
     parser.add_argument('--min-radius', type=float, default=2.0,
                        help='血管最小半径（默认: 2.0）')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='批量处理时的并行进程数（默认: 1）')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='批量处理时每次分发给进程的任务数（默认: 1）')
     
     # 输出参数
     parser.add_argument('-v', '--verbose', action='store_true',
@@ -146,21 +150,17 @@ def process_with_config(processor, config_file, args):
 
 def process_batch(processor, batch_file, args):
     """批量处理模式"""
+    results = []
+    success_count = 0
+    error = None
     try:
-        with open(batch_file, 'r', encoding='utf-8') as f:
-            batch_configs = json.load(f)
+        # 边解析边分发任务，无需等待整个批量文件读取完毕；多进程时每 batch_size 个任务打包提交一次
+        task_results = processor.iter_batch(
+            _iter_batch_configs(batch_file), max_workers=args.workers, batch_size=args.batch_size
+        )
         
-        if not isinstance(batch_configs, list):
-            raise ValueError("批量配置文件应包含配置列表")
-        
-        results = []
-        success_count = 0
-        
-        for i, config in enumerate(batch_configs, 1):
-            if not args.quiet:
-                print(f"\n处理第 {i}/{len(batch_configs)} 个任务...")
-            
-            result = processor.process_complete_pipeline(config)
+        # 结果按任务顺序返回
+        for i, result in enumerate(task_results, 1):
             results.append(result)
             
             if result['success']:
@@ -170,35 +170,75 @@ def process_batch(processor, batch_file, args):
             else:
                 if not args.quiet:
                     print(f"❌ 任务 {i} 处理失败: {result['error']}")
-        
-        # 汇总结果
-        total_time = sum(r['processing_time'] for r in results)
-        
-        summary_result = {
-            'success': True,
-            'batch_summary': {
-                'total_tasks': len(batch_configs),
-                'success_count': success_count,
-                'failure_count': len(batch_configs) - success_count,
-                'total_time': total_time,
-                'average_time': total_time / len(batch_configs)
-            },
-            'processing_time': total_time,
-            'individual_results': results
-        }
-        
-        if not args.quiet:
-            print(f"\n📊 批量处理汇总:")
-            print(f"成功任务: {success_count}/{len(batch_configs)}")
-            print(f"总耗时: {total_time:.2f} 秒")
-            print(f"平均耗时: {total_time/len(batch_configs):.2f} 秒/任务")
-        
-        return summary_result
-        
     except FileNotFoundError:
-        raise ValueError(f"批量配置文件不存在: {batch_file}")
+        error = f"批量配置文件不存在: {batch_file}"
     except json.JSONDecodeError as e:
-        raise ValueError(f"批量配置文件格式错误: {e}")
+        error = f"批量配置文件格式错误: {e}"
+    except ValueError as e:
+        error = str(e)
+    
+    # 配置文件有误且没有任何任务完成时，与之前一样直接报错
+    if error is not None and not results:
+        raise ValueError(error)
+    
+    # 汇总结果（配置文件中途出错时为已完成任务的部分结果）
+    total_tasks = len(results)
+    total_time = sum(r['processing_time'] for r in results)
+    average_time = total_time / total_tasks if total_tasks else 0
+    
+    summary_result = {
+        'success': True,
+        'batch_summary': {
+            'total_tasks': total_tasks,
+            'success_count': success_count,
+            'failure_count': total_tasks - success_count,
+            'total_time': total_time,
+            'average_time': average_time
+        },
+        'processing_time': total_time,
+        'individual_results': results
+    }
+    
+    if error is not None:
+        # 只返回部分结果，批量处理整体视为失败
+        summary_result['success'] = False
+        summary_result['error'] = f"{error}（仅完成前 {total_tasks} 个任务，其余任务未处理）"
+    
+    if not args.quiet:
+        print(f"\n📊 批量处理汇总{'（部分结果）' if error is not None else ''}:")
+        print(f"成功任务: {success_count}/{total_tasks}")
+        print(f"总耗时: {total_time:.2f} 秒")
+        print(f"平均耗时: {average_time:.2f} 秒/任务")
+    
+    return summary_result
+
+
+def _iter_batch_configs(batch_file):
+    """
+    逐个读取批量配置文件中的任务配置
+    
+    安装了 ijson 时流式解析，常数内存且可在读取过程中开始处理；
+    否则退回到 json.load 一次性解析
+    """
+    with open(batch_file, 'rb') as f:
+        # 预读首个非空白字符，确认顶层为列表
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first != b'[':
+            raise ValueError("批量配置文件应包含配置列表")
+        f.seek(0)
+        
+        try:
+            import ijson
+        except ImportError:
+            yield from json.load(f)
+            return
+        
+        try:
+            yield from ijson.items(f, 'item', use_float=True)
+        except ijson.JSONError as e:
+            raise ValueError(f"批量配置文件格式错误: {e}")
 
 
 def create_sample_config():
@@ -49,5 +49,11 @@ setup(
             "flake8>=3.8",
             "mypy>=0.800",
         ],
+        "batch": [
+            "ijson>=3.1",
+        ],
+        "fast": [
+            "connected-components-3d>=3.12",
+        ],
     },
 ) 
\ No newline at end of file
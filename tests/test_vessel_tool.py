@@ -5,9 +5,22 @@ Vessel Tool 测试文件
 
 import unittest
 import numpy as np
+import SimpleITK as sitk
 import tempfile
 import os
-from vessel_tool import VesselProcessor, VesselBase, VesselTree, VesselVisualizer
+import io
+import sys
+import contextlib
+import json
+import argparse
+from unittest import mock
+from vessel_tool import VesselProcessor, VesselBase, VesselTree, VesselTreeSoA, VesselVisualizer
+import cli
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 class TestVesselBase(unittest.TestCase):
@@ -29,6 +42,42 @@ class TestVesselBase(unittest.TestCase):
         self.assertGreaterEqual(result.min(), 0)
         self.assertLessEqual(result.max()-255, 1e-8)
     
+    def test_dicom_series_spacing(self):
+        """测试层间距不均匀时，只读文件头得到的层间距与 ImageSeriesReader 一致"""
+        temp_dir = tempfile.mkdtemp()
+        writer = sitk.ImageFileWriter()
+        writer.KeepOriginalImageUIDOn()
+        for i, z in enumerate([0, 1, 3, 4, 6, 7.5]):
+            image = sitk.GetImageFromArray(np.full((4, 5), i, dtype=np.int16))
+            image.SetSpacing((0.7, 0.8))
+            image.SetMetaData("0020|0032", f"-10\\5\\{30 + z}")
+            image.SetMetaData("0020|0037", "1\\0\\0\\0\\1\\0")
+            image.SetMetaData("0020|000e", "1.2.826.0.1.3680043.2.1125.1")
+            image.SetMetaData("0020|0013", str(i))
+            writer.SetFileName(os.path.join(temp_dir, f"{i}.dcm"))
+            writer.Execute(image)
+        
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(sitk.ImageSeriesReader.GetGDCMSeriesFileNames(temp_dir))
+        expected = np.array(reader.Execute().GetSpacing())
+        
+        _, spacing, _, _ = self.base.load_dicom_series_as_3d_array(temp_dir, metadata_only=True)
+        
+        # 验证结果：层间距为 (7.5 - 0) / 5，而不是前两层的间距1
+        np.testing.assert_allclose(spacing, expected)
+        self.assertAlmostEqual(spacing[2], 1.5)
+        
+        # read_data 使用的并行逐层读取与 ImageSeriesReader 整体读取的结果完全一致
+        full = self.base.load_dicom_series_as_3d_array(temp_dir)
+        parallel = self.base.load_dicom_series_as_3d_array(temp_dir, parallel=True)
+        self.assertEqual(parallel[0].shape, (5, 4, 6))
+        np.testing.assert_array_equal(parallel[0], full[0])
+        for a, b in zip(parallel[1:], full[1:]):
+            np.testing.assert_allclose(a, b)
+        
+        import shutil
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
     def test_cosine_similarity(self):
         """测试余弦相似度计算"""
         v1 = np.array([1, 0, 0])
@@ -42,6 +91,9 @@ class TestVesselBase(unittest.TestCase):
         # 相同向量的余弦相似度应该为1
         cos_sim_same = self.base.get_cosine_similarity(v1, v3)
         self.assertAlmostEqual(cos_sim_same, 1, places=5)
+        
+        # 零向量（相邻两点重合）返回nan而不是抛出异常
+        self.assertTrue(np.isnan(self.base.get_cosine_similarity(np.zeros(3), v1)))
     
     def test_gaussian_filter_smooth(self):
         """测试高斯滤波平滑"""
@@ -56,6 +108,43 @@ class TestVesselBase(unittest.TestCase):
         # 平滑后的点应该与原始点有相似的趋势但更平滑
         # print(smoothed.mean(axis=0),points.mean(axis = 0))
         self.assertTrue(np.allclose(smoothed.mean(axis=0), points.mean(axis=0), rtol=0.6))
+    
+    def test_retain_largest_connected_component(self):
+        """测试最大连通组件保留"""
+        data = np.zeros((10, 10, 10), dtype=np.uint8)
+        data[1:4, 1:4, 1:4] = 1  # 大组件
+        data[7, 7, 7] = 1        # 小组件
+        data[4, 4, 4] = 1        # 与大组件对角相连
+        
+        result, bbox = self.base.retain_largest_connected_component(data)
+        
+        # 验证结果
+        self.assertEqual(result.dtype, data.dtype)
+        self.assertEqual(result.sum(), 28)
+        self.assertEqual(result[7, 7, 7], 0)
+        self.assertEqual(bbox, (1, 1, 1, 5, 5, 5))
+    
+    def test_mean_insert(self):
+        """测试均值点插入"""
+        points = [[0, 0, 0], [2, 0, 0], [2, 4, 0]]
+        
+        result = self.base.mean_insert(points)
+        
+        # 验证结果：原始点与中点交替排列，末尾为微小偏移的终点
+        expected = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [2, 2, 0], [2, 4, 0], [2.001, 4.001, 0.001]]
+        np.testing.assert_allclose(result, expected)
+    
+    def test_nearest_zoom(self):
+        """测试最近邻缩放与 scipy 一致"""
+        import scipy.ndimage
+        data = np.random.randint(0, 3, (16, 12, 5)).astype(np.uint8)
+        zoom_factors = (2.0, 0.75, 1)
+        
+        result = self.base.nearest_zoom(data, zoom_factors)
+        
+        # 验证结果
+        self.assertEqual(result.dtype, data.dtype)
+        np.testing.assert_array_equal(result, scipy.ndimage.zoom(data, zoom_factors, order=0))
 
 
 class TestVesselTree(unittest.TestCase):
@@ -80,6 +169,17 @@ class TestVesselTree(unittest.TestCase):
         self.assertGreater(len(seg_dic), 0)
         self.assertGreater(grades.max(), 0)
     
+    def test_neighbor_directions(self):
+        """测试26邻域偏移完整且无重复"""
+        import itertools
+        from vessel_tool.tree import _DIRS_26
+        
+        expected = set(itertools.product((-1, 0, 1), repeat=3)) - {(0, 0, 0)}
+        
+        # 验证结果
+        self.assertEqual(_DIRS_26.shape, (26, 3))
+        self.assertEqual({tuple(d) for d in _DIRS_26.tolist()}, expected)
+    
     def test_tree_depth_calculation(self):
         """测试树深度计算"""
         # 创建测试树结构
@@ -115,6 +215,43 @@ class TestVesselTree(unittest.TestCase):
         # 验证深度计算
         self.assertGreaterEqual(max_deep, 2)
         self.assertGreaterEqual(max_length, 1)
+    
+    def test_tree_soa_round_trip(self):
+        """测试树的数组结构表示与字典互相转换"""
+        test_tree = {
+            'line': [((0, 0, 0), (0, 0, 0)), ((1, 0, 0), (0, 0, 0)), ((2, 0, 0), (1, 0, 0))],
+            'subtree': [
+                {
+                    'line': [((1, 1, 0), (1, 0, 0)), ((1, 2, 0), (1, 1, 0))],
+                    'subtree': [], 'deep': [], 'subLength': [], 'dividePointIndex': [], 'layer': 1
+                },
+                {
+                    'line': [((2, 1, 0), (2, 0, 0))],
+                    'subtree': [], 'deep': [], 'subLength': [], 'dividePointIndex': [], 'layer': 1
+                }
+            ],
+            'deep': [], 'subLength': [], 'dividePointIndex': [1, 2], 'layer': 0
+        }
+        
+        soa = VesselTreeSoA.from_dict(test_tree)
+        
+        # 验证数组结构；深度计算和统计只用到结构，不读取点坐标
+        self.assertEqual(soa.num_nodes, 3)
+        self.assertEqual(soa.parent.tolist(), [-1, 0, 0])
+        self.assertEqual(soa.depth.tolist(), [0, 1, 1])
+        self.assertEqual(soa.assign_depth(), (2, 4))
+        self.assertEqual(soa.statistics()['total_points'], 6)
+        self.assertIsNone(soa._points)
+        self.assertEqual(soa.points.shape, (6, 3))
+        self.assertEqual(soa.priors[1].tolist(), [0, 0, 0])
+        
+        # 验证转换回字典后结构一致
+        restored = soa.to_dict()
+        self.assertEqual(restored['line'], test_tree['line'])
+        self.assertEqual(restored['dividePointIndex'], [1, 2])
+        self.assertEqual(restored['deep'], [1, 1])
+        self.assertEqual(restored['subLength'], [2, 1])
+        self.assertEqual(restored['subtree'][0]['line'], test_tree['subtree'][0]['line'])
 
 
 class TestVesselVisualizer(unittest.TestCase):
@@ -146,6 +283,38 @@ class TestVesselVisualizer(unittest.TestCase):
         # 验证结果
         self.assertGreater(tube.GetNumberOfPoints(), 0)
         self.assertGreater(tube.GetNumberOfCells(), 0)
+    
+    def test_merge_many(self):
+        """测试多个网格一次合并"""
+        spheres = [self.visualizer.create_hemisphere(1.0, (i * 3, 0, 0), 10) for i in range(3)]
+        
+        merged = self.visualizer.merge_many(spheres)
+        
+        # 验证结果：点数和单元数为各网格之和
+        self.assertEqual(merged.GetNumberOfPoints(), sum(s.GetNumberOfPoints() for s in spheres))
+        self.assertEqual(merged.GetNumberOfCells(), sum(s.GetNumberOfCells() for s in spheres))
+    
+    def test_smooth_mesh(self):
+        """测试网格平滑及已弃用的 relaxation_factor 参数"""
+        sphere = self.visualizer.create_hemisphere(1.0, (0, 0, 0), 10)
+        
+        smoothed = self.visualizer.smooth_mesh(sphere, pass_band=0.05)
+        self.assertEqual(smoothed.GetNumberOfPoints(), sphere.GetNumberOfPoints())
+        
+        with self.assertWarns(DeprecationWarning):
+            self.visualizer.smooth_mesh(sphere, 15, 0.5)
+    
+    def test_cached_filter_outputs_independent(self):
+        """测试复用滤波器时，之前返回的网格不会被后续调用改写"""
+        small = self.visualizer.create_hemisphere(1.0, (0, 0, 0), 10)
+        bounds = small.GetBounds()
+        n_points = small.GetNumberOfPoints()
+        
+        large = self.visualizer.create_hemisphere(5.0, (10, 0, 0), 20)
+        
+        self.assertIsNot(small, large)
+        self.assertEqual(small.GetNumberOfPoints(), n_points)
+        self.assertEqual(small.GetBounds(), bounds)
 
 
 class TestVesselProcessor(unittest.TestCase):
@@ -195,6 +364,126 @@ class TestVesselProcessor(unittest.TestCase):
         self.assertIn('max_depth', stats)
         self.assertGreater(stats['total_branches'], 0)
         self.assertGreater(stats['max_depth'], 0)
+    
+    def test_process_batch(self):
+        """测试多进程批量处理"""
+        configs = [{
+            'dcm_path': os.path.join(self.temp_dir, f'missing_{i}'),
+            'seg_path': os.path.join(self.temp_dir, 'missing.npy'),
+            'output_folder': os.path.join(self.temp_dir, f'out_{i}')
+        } for i in range(3)]
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = self.processor.process_batch(configs, max_workers=2)
+        
+        # 验证结果：按输入顺序返回，失败任务同样有结果，每个任务完成时输出一行进度
+        self.assertEqual(len(results), 3)
+        progress = [line for line in output.getvalue().splitlines() if line.startswith('批量处理进度')]
+        self.assertEqual(progress, [f"批量处理进度: 第 {i} 个任务已完成（失败）" for i in range(1, 4)])
+        self.assertTrue(all(not r['success'] for r in results))
+        self.assertTrue(all('error' in r for r in results))
+        # 不再为任务或工作进程另建临时文件夹
+        self.assertFalse([d for d in os.listdir(self.temp_dir) if d.startswith(('task_', 'worker_'))])
+    
+    def test_iter_batch_config_error(self):
+        """测试读取配置出错时，取消未开始的任务并在产出已完成结果后抛出异常"""
+        def configs():
+            for i in range(2):
+                yield {
+                    'dcm_path': os.path.join(self.temp_dir, f'missing_{i}'),
+                    'seg_path': os.path.join(self.temp_dir, 'missing.npy'),
+                    'output_folder': os.path.join(self.temp_dir, f'out_{i}')
+                }
+            raise ValueError("配置读取失败")
+        
+        results = []
+        with self.assertRaises(ValueError):
+            for result in self.processor.iter_batch(configs(), max_workers=2):
+                results.append(result)
+        
+        self.assertLessEqual(len(results), 2)
+        self.assertTrue(all(not r['success'] for r in results))
+
+
+class TestBatchConfig(unittest.TestCase):
+    """测试命令行批量配置文件的读取"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.configs = [{
+            'dcm_path': os.path.join(self.temp_dir, f'missing_{i}'),
+            'seg_path': os.path.join(self.temp_dir, 'missing.npy'),
+            'output_folder': os.path.join(self.temp_dir, f'out_{i}'),
+            'scale': 0.5
+        } for i in range(4)]
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def _write(self, text):
+        path = os.path.join(self.temp_dir, 'batch.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+    
+    @unittest.skipIf(ijson is None, "未安装 ijson")
+    def test_streaming(self):
+        """测试 ijson 流式读取，数值为普通浮点数"""
+        path = self._write(json.dumps(self.configs))
+        
+        configs = cli._iter_batch_configs(path)
+        
+        # 验证结果：生成器逐个产出配置
+        self.assertEqual(next(configs), self.configs[0])
+        self.assertEqual(list(configs), self.configs[1:])
+    
+    def test_json_fallback(self):
+        """测试未安装 ijson 时退回 json.load"""
+        path = self._write(json.dumps(self.configs))
+        
+        with mock.patch.dict(sys.modules, {'ijson': None}):
+            configs = list(cli._iter_batch_configs(path))
+        
+        self.assertEqual(configs, self.configs)
+    
+    def test_invalid_files(self):
+        """测试顶层不是列表或格式错误的批量配置文件"""
+        not_list = self._write(json.dumps(self.configs[0]))
+        with self.assertRaises(ValueError):
+            list(cli._iter_batch_configs(not_list))
+        
+        truncated = self._write(json.dumps(self.configs)[:-10])
+        with mock.patch.dict(sys.modules, {'ijson': None}):
+            with self.assertRaises(ValueError):
+                list(cli._iter_batch_configs(truncated))
+        if ijson is not None:
+            with self.assertRaises(ValueError):
+                list(cli._iter_batch_configs(truncated))
+    
+    @unittest.skipIf(ijson is None, "未安装 ijson")
+    def test_process_batch_truncated(self):
+        """测试批量文件中途出错时只返回已读取任务的部分结果"""
+        # 截断在第4个配置中间，前3个配置可以被流式读取出来
+        path = self._write(json.dumps(self.configs)[:-10])
+        args = argparse.Namespace(workers=1, batch_size=1, quiet=True)
+        processor = VesselProcessor(temp_folder=os.path.join(self.temp_dir, 'tmp'))
+        
+        result = cli.process_batch(processor, path, args)
+        
+        self.assertFalse(result['success'])
+        self.assertIn('error', result)
+        self.assertEqual(result['batch_summary']['total_tasks'], 3)
+        self.assertEqual(len(result['individual_results']), 3)
+    
+    def test_process_batch_missing_file(self):
+        """测试批量文件不存在时直接报错"""
+        args = argparse.Namespace(workers=2, batch_size=1, quiet=True)
+        processor = VesselProcessor(temp_folder=os.path.join(self.temp_dir, 'tmp'))
+        
+        with self.assertRaises(ValueError):
+            cli.process_batch(processor, os.path.join(self.temp_dir, 'missing.json'), args)
 
 
 if __name__ == '__main__':
@@ -12,13 +12,14 @@ __version__ = "1.0.0"
 __author__ = "Vessel Tool Team"
 
 from .base import VesselBase
-from .tree import VesselTree
+from .tree import VesselTree, VesselTreeSoA
 from .visualization import VesselVisualizer
 from .main import VesselProcessor
 
 __all__ = [
     'VesselBase',
     'VesselTree', 
+    'VesselTreeSoA',
     'VesselVisualizer',
     'VesselProcessor'
 ] 
\ No newline at end of file
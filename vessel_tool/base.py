@@ -3,48 +3,157 @@
 包含DICOM读取、图像处理、连通组件分析等基础功能
 """
 
+import logging
+import math
+import os
 import numpy as np
 import SimpleITK as sitk
 from scipy import ndimage
-from skimage import measure, morphology
+from skimage import morphology
 from scipy.interpolate import splprep, splev
 from scipy.ndimage import gaussian_filter1d
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 
+try:
+    import cc3d
+except ImportError:
+    cc3d = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentRegion:
+    """
+    连通组件的轻量描述，只记录标签、体素数和外接框，坐标在访问时才计算
+    
+    提供与 skimage RegionProperties 相同的 label、area、bbox、coords 属性
+    """
+    
+    __slots__ = ('label', 'area', 'slices', '_labels')
+    
+    def __init__(self, labels, label, area, slices):
+        self._labels = labels
+        self.label = int(label)
+        self.area = int(area)
+        self.slices = slices
+    
+    @property
+    def bbox(self):
+        return tuple(sl.start for sl in self.slices) + tuple(sl.stop for sl in self.slices)
+    
+    @property
+    def coords(self):
+        offset = np.array([sl.start for sl in self.slices])
+        return np.argwhere(self._labels[self.slices] == self.label) + offset
+
 
 class VesselBase(ABC):
     """血管处理基础类，提供通用的图像处理功能"""
     
+    # ww_wc 分块处理时每块输出的字节数上限，使每块驻留在CPU缓存中
+    ww_wc_block_bytes = 1 << 18
+    
     def __init__(self):
         pass
     
-    def load_dicom_series_as_3d_array(self, folder_path):
+    def load_dicom_series_as_3d_array(self, folder_path, bbox=None, metadata_only=False,
+                                      parallel=False, max_workers=None):
         """
         从文件夹中读取 DICOM 序列并转换为三维 NumPy 数组
         
         参数：
         folder_path: 包含 DICOM 文件的文件夹路径
+        bbox: 可选的裁剪范围 [[x0, x1], [y0, y1], [z0, z1]]，格式与肝门边界框一致，
+              指定时只读取范围内的切片，返回的原点相应平移到裁剪起点
+        metadata_only: 为True时只读取文件头信息，图像数组返回None
+        parallel: 为True时使用线程池并行读取和解码各切片
+        max_workers: 并行读取的线程数，默认为CPU核数
         
         返回：
-        tuple: (3D图像数组, 像素间距, 原点, 方向矩阵)
+        tuple: (3D图像数组, 像素间距, 原点, 方向矩阵)，图像数组按 (x, y, z) 排列，
+               为C连续且独立持有内存的数组（不是 SimpleITK 缓冲区的视图）
         """
+        # 获取文件夹中所有 DICOM 文件的文件名（已按切片位置排序）
+        dicom_series = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(folder_path)
+        
+        if metadata_only:
+            spacing, origin, direction = self._read_series_information(dicom_series)
+            return None, spacing, origin, direction
+        
+        if bbox is not None or parallel:
+            spacing, origin, direction = self._read_series_information(dicom_series)
+            if bbox is not None:
+                (x0, x1), (y0, y1), (z0, z1) = np.maximum(np.asarray(bbox, dtype=int), 0)
+                origin = origin + direction @ (np.array([x0, y0, z0]) * spacing)
+            else:
+                x0 = y0 = z0 = 0
+                x1 = y1 = z1 = None
+            
+            # 只解码范围内的切片，并在平面内裁剪；由首张切片确定形状和类型后一次性分配，
+            # 各切片直接写入对应层，不再先收集列表再 np.stack
+            files = dicom_series[z0:z1]
+            image = sitk.ReadImage(files[0])
+            first = sitk.GetArrayViewFromImage(image)[0, y0:y1, x0:x1]
+            img_array = np.empty((len(files),) + first.shape, dtype=first.dtype)
+            img_array[0] = first
+            del image, first
+            
+            def read_slice(z):
+                image = sitk.ReadImage(files[z])
+                img_array[z] = sitk.GetArrayViewFromImage(image)[0, y0:y1, x0:x1]
+            
+            if parallel:
+                with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+                    list(ex.map(read_slice, range(1, len(files))))
+            else:
+                for z in range(1, len(files)):
+                    read_slice(z)
+            return np.ascontiguousarray(np.transpose(img_array, (2, 1, 0))), spacing, origin, direction
+        
         # 使用 ImageSeriesReader 读取 DICOM 序列
         reader = sitk.ImageSeriesReader()
-        # 获取文件夹中所有 DICOM 文件的文件名
-        dicom_series = reader.GetGDCMSeriesFileNames(folder_path)
         reader.SetFileNames(dicom_series)
         # 读取图像
         image = reader.Execute()
-        # 将 SimpleITK 图像转换为 NumPy 数组
-        img_array = sitk.GetArrayFromImage(image)
+        # 以视图方式访问 SimpleITK 缓冲区，转置后只做一次C连续拷贝
+        img_array = np.ascontiguousarray(np.transpose(sitk.GetArrayViewFromImage(image), (2, 1, 0)))
         
         spacing = np.array(image.GetSpacing())
         direction = np.array(image.GetDirection()).reshape(3, 3)
         origin = np.array(image.GetOrigin())
         
-        return np.transpose(img_array, (2, 1, 0)), spacing, origin, direction
+        return img_array, spacing, origin, direction
+    
+    def _read_series_information(self, dicom_series):
+        """
+        只读取文件头，获取序列的像素间距、原点和方向矩阵
+        
+        参数：
+        dicom_series: 按切片位置排序的 DICOM 文件名列表
+        
+        返回：
+        tuple: (像素间距, 原点, 方向矩阵)
+        """
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(dicom_series[0])
+        reader.ReadImageInformation()
+        
+        spacing = np.array(reader.GetSpacing())
+        origin = np.array(reader.GetOrigin())
+        direction = np.array(reader.GetDirection()).reshape(3, 3)
+        
+        # 层间距取首末两层位置沿法向的距离除以层数减一（平均层间距），与 ImageSeriesReader 一致
+        if len(dicom_series) > 1:
+            reader.SetFileName(dicom_series[-1])
+            reader.ReadImageInformation()
+            extent = np.dot(np.array(reader.GetOrigin()) - origin, direction[:, 2])
+            spacing[2] = abs(extent) / (len(dicom_series) - 1)
+        
+        return spacing, origin, direction
     
     def retain_largest_connected_component(self, data):
         """
@@ -56,40 +165,72 @@ class VesselBase(ABC):
         返回：
         tuple: (处理后的数组, 边界框)
         """
-        st = time.time()
-        labeled_array = measure.label(data, background=0)
-        print(f'labeled_array time: {time.time() - st:.3f}s')
-        
-        st = time.time()
-        regions = measure.regionprops(labeled_array)
-        print(f'regions time: {time.time() - st:.3f}s')
-        
-        st = time.time()
-        regions = sorted(regions, key=lambda x: x.area, reverse=True)
-        print(f'sorted time: {time.time() - st:.3f}s')
-        
-        st = time.time()
-        new_data = np.zeros_like(data)
-        if len(regions) > 0:
-            largest_component = regions[0]
-            coords = largest_component.coords
-            new_data[coords[:, 0], coords[:, 1], coords[:, 2]] = 1
-            print(f'final time: {time.time() - st:.3f}s')
-            return new_data, largest_component.bbox
-        else:
+        # 计时信息只在DEBUG级别输出，否则不计时也不打印
+        timing = logger.isEnabledFor(logging.DEBUG)
+        
+        if timing:
+            st = time.perf_counter()
+        # 26邻域连通，与 skimage.measure.label 的默认连通性一致
+        labeled_array, num = self._label_26(data)
+        if timing:
+            logger.debug('labeled_array time: %.3fs', time.perf_counter() - st)
+        
+        if num == 0:
             print("错误：未找到连通组件")
-            return new_data, None
+            return np.zeros_like(data), None
+        
+        if timing:
+            st = time.perf_counter()
+        sizes = np.bincount(labeled_array.ravel())
+        sizes[0] = 0
+        max_id = int(sizes.argmax())
+        if timing:
+            logger.debug('sizes time: %.3fs', time.perf_counter() - st)
+        
+        if timing:
+            st = time.perf_counter()
+        # 比较结果直接写入目标类型的数组，不生成中间的布尔数组
+        new_data = np.empty(data.shape, dtype=data.dtype)
+        np.equal(labeled_array, max_id, out=new_data, casting='unsafe')
+        slices = ndimage.find_objects(labeled_array, max_label=max_id)[max_id - 1]
+        bbox = tuple(sl.start for sl in slices) + tuple(sl.stop for sl in slices)
+        if timing:
+            logger.debug('final time: %.3fs', time.perf_counter() - st)
+        return new_data, bbox
     
-    def ww_wc(self, img, k='lungNoduleClass'):
+    def nearest_zoom(self, data, zoom_factors):
+        """
+        最近邻缩放，采样位置与 scipy.ndimage.zoom(data, zoom_factors, order=0) 一致，
+        但直接用整数索引取值，不经过样条插值流程，也不改变数据类型
+        
+        参数：
+        data: 三维数组
+        zoom_factors: 各轴缩放因子
+        
+        返回：
+        缩放后的数组
+        """
+        index = []
+        for n, z in zip(data.shape, zoom_factors):
+            out_n = int(round(n * z))
+            # 与 scipy 相同的坐标映射：输出两端对齐输入两端，再四舍五入到最近的体素；
+            # 末端坐标因浮点误差略超出 n-1 时 scipy 会填0，这里截断到最后一个体素
+            scale = (n - 1) / (out_n - 1) if out_n > 1 else 0
+            idx = np.floor(np.arange(out_n) * scale + 0.5).astype(np.intp)
+            index.append(np.minimum(idx, n - 1, out=idx))
+        return data[np.ix_(*index)]
+    
+    def ww_wc(self, img, k='lungNoduleClass', out=None):
         """
         窗宽窗位调整
         
         参数：
         img: 输入图像
         k: 预设类型
+        out: 可选的float32输出缓冲区，形状需与img一致，可在多次调用间复用
         
         返回：
-        调整后的图像
+        调整后的图像（float32）
         """
         ref_dict = {
             "tsetra": [-600, 5500], 
@@ -105,13 +246,22 @@ class VesselBase(ABC):
         
         dfactor = 255.0 / (maxvalue - minvalue)
         
-        zo = np.ones(img.shape) * minvalue
-        Two55 = np.ones(img.shape) * maxvalue
-        img = np.where(img < minvalue, zo, img)
-        img = np.where(img > maxvalue, Two55, img)
-        img = ((img - minvalue) * dfactor)
-        
-        return img
+        # 原地裁剪和线性变换，避免生成整幅体数据大小的临时数组；
+        # 沿第一维分块，每块的三步运算在缓存内完成，整幅体数据只需从内存读写一次
+        img = np.asarray(img)
+        if out is None:
+            out = np.empty(img.shape, dtype=np.float32)
+        if img.ndim == 0:
+            return self.ww_wc(img.reshape(1), k, out.reshape(1)).reshape(())
+        
+        step = max(1, self.ww_wc_block_bytes // max(out[0].nbytes, 1))
+        for start in range(0, len(img), step):
+            block = out[start:start + step]
+            np.clip(img[start:start + step], minvalue, maxvalue, out=block)
+            np.subtract(block, minvalue, out=block)
+            np.multiply(block, dfactor, out=block)
+        
+        return out
     
     def get_cosine_similarity(self, v1, v2):
         """
@@ -121,8 +271,18 @@ class VesselBase(ABC):
         v1, v2: 输入向量
         
         返回：
-        余弦相似度值
+        余弦相似度值；任一向量长度为0时返回nan
         """
+        if len(v1) == 3 and len(v2) == 3:
+            # 三维向量直接用标量运算，避免NumPy的临时数组和调度开销
+            a0, a1, a2 = (float(x) for x in v1)
+            b0, b1, b2 = (float(x) for x in v2)
+            norm = math.sqrt((a0 * a0 + a1 * a1 + a2 * a2) * (b0 * b0 + b1 * b1 + b2 * b2))
+            if norm == 0:
+                # 与NumPy路径的结果一致（如中心线上相邻两点重合）
+                return float('nan')
+            return (a0 * b0 + a1 * b1 + a2 * b2) / norm
+        
         V1 = v1 / np.linalg.norm(v1)
         V2 = v2 / np.linalg.norm(v2)
         return np.dot(V1, V2)
@@ -138,9 +298,11 @@ class VesselBase(ABC):
         返回：
         平滑后的点集
         """
-        smoothed_points = np.copy(points)
-        for i in range(3):  # 假设点是三维的
-            smoothed_points[:, i] = gaussian_filter1d(points[:, i], sigma)
+        points = np.asarray(points, dtype=np.float64)
+        # 沿点序方向一次性对所有坐标分量滤波；输出缓冲区会被完整覆盖，无需初始化。
+        # 边界按端点值延拓，平滑后中心线端点不会向内收缩
+        smoothed_points = np.empty_like(points)
+        gaussian_filter1d(points, sigma, axis=0, mode='nearest', output=smoothed_points)
         return smoothed_points
     
     def fit_curve_and_compute_tangents(self, points):
@@ -182,8 +344,9 @@ class VesselBase(ABC):
         # 求解切线方向 (求导)
         tangents = np.array(splev(u, tck, der=1))  # der=1 表示求一阶导数
         tangents = tangents.T  # 转置回 (n, 3) 形式
-        # 归一化切线向量
-        tangents = tangents / np.linalg.norm(tangents, axis=1)[:, np.newaxis]
+        # 归一化切线向量（einsum一次计算各行平方和，原地相除）
+        norms = np.sqrt(np.einsum('ij,ij->i', tangents, tangents))
+        tangents /= norms[:, np.newaxis]
         return tangents
     
     def mean_insert(self, points, num_insert=3):
@@ -195,18 +358,17 @@ class VesselBase(ABC):
         num_insert: 插入点数
         
         返回：
-        插入点后的点集
-        """
-        newpoints = []
-        for i, point in enumerate(points):
-            if i + 1 < len(points):
-                newpoints.append(point)
-                newpoints.append(((np.array(point) + np.array(points[i+1])) / 2).tolist())
-        newpoints.append(points[-1])
-        newpoints.append((np.array(points[-1]) + 0.001).tolist())
+        插入点后的点集，形状为 (2N, D) 的数组
+        """
+        pts = np.asarray(points, dtype=np.float64)
+        # 偶数位置放原始点，奇数位置放相邻点的中点，末尾追加一个微小偏移的终点
+        newpoints = np.empty((2 * len(pts), pts.shape[1]))
+        newpoints[0::2] = pts
+        newpoints[1:-1:2] = (pts[:-1] + pts[1:]) * 0.5
+        newpoints[-1] = pts[-1] + 0.001
         return newpoints
     
-    def retain_connected_component_list(self, data, cls, pixel_threshold=50):
+    def retain_connected_component_list(self, data, cls, pixel_threshold=50, keep_small=True):
         """
         获取连通组件列表，按大小分类
         
@@ -214,21 +376,87 @@ class VesselBase(ABC):
         data: 输入数据
         cls: 类别标签
         pixel_threshold: 像素阈值
+        keep_small: 是否骨架化体素数低于阈值的小组件，调用方不使用小组件列表时可设为False以跳过这部分计算
         
         返回：
-        tuple: (大连通组件列表, 小连通组件列表)
+        tuple: (大连通组件列表, 小连通组件列表, 骨架标记数组, 大组件标签数组, 小组件标签数组)
+               调用方可直接用标记数组和标签重建掩膜，无需再次做连通域标记
         """
+        # 二值体数据统一以uint8存储（由布尔结果零拷贝视图得到）
         if cls == -1:
-            now_data = np.where(data > 0, 1, 0)    
+            now_data = (data > 0).view(np.uint8)
         else:
-            now_data = np.where(data == cls, 1, 0)
+            now_data = (data == cls).view(np.uint8)
+        
+        if not keep_small:
+            # 骨架是组件的子集，体素数低于阈值的组件其骨架必然也低于阈值，
+            # 先按原始体数据的连通域大小剔除小组件，只对大组件做骨架化
+            labels, num = self._label_26(now_data)
+            sizes = np.bincount(labels.ravel())
+            sizes[0] = 0
+            now_data = (sizes >= pixel_threshold).view(np.uint8)[labels]
+        
+        skeleton = self._skeletonize_in_bbox(now_data)
+        labeled_array, num = self._label_26(skeleton)
+        areas, bboxes = self._fast_regions(labeled_array, num)
+        
+        # 按体素数从大到小排列，面积相同时保持标签顺序
+        order = np.argsort(-areas, kind='stable')
+        is_big = areas[order] >= pixel_threshold
+        big_ids = (order[is_big] + 1).astype(np.int32)
+        small_ids = (order[~is_big] + 1).astype(np.int32)
+        
+        bigger_regions = [ComponentRegion(labeled_array, i, areas[i - 1], bboxes[i - 1]) for i in big_ids.tolist()]
+        smaller_regions = [ComponentRegion(labeled_array, i, areas[i - 1], bboxes[i - 1]) for i in small_ids.tolist()]
+        
+        return bigger_regions, smaller_regions, labeled_array, big_ids, small_ids
+    
+    def _label_26(self, data):
+        """
+        26邻域连通域标记，非零体素视为前景
         
-        skeleton = morphology.skeletonize(now_data)
-        labeled_array = measure.label(skeleton, background=0)
-        regions = measure.regionprops(labeled_array)
-        regions = sorted(regions, key=lambda x: x.area, reverse=True)
+        安装了 connected-components-3d (cc3d) 时使用其实现，速度更快、内存更省；
+        否则使用 scipy.ndimage.label，两者都按光栅扫描顺序编号，结果一致
         
-        bigger_regions = [rg for rg in regions if rg.area >= pixel_threshold]
-        smaller_regions = [rg for rg in regions if rg.area < pixel_threshold]
+        参数：
+        data: 三维数组
         
-        return bigger_regions, smaller_regions 
\ No newline at end of file
+        返回：
+        tuple: (标记数组, 组件数量)
+        """
+        if cc3d is not None:
+            labels, num = cc3d.connected_components(data, connectivity=26, return_N=True, binary_image=True)
+            return labels, int(num)
+        return ndimage.label(data, structure=np.ones((3, 3, 3)))
+    
+    def _fast_regions(self, labels, num):
+        """
+        一次性统计所有连通组件的体素数和外接框
+        
+        参数：
+        labels: 连通域标记数组
+        num: 组件数量
+        
+        返回：
+        tuple: (各组件体素数数组, 各组件外接框切片列表)，第i项对应标签i+1
+        """
+        areas = np.bincount(labels.ravel(), minlength=num + 1)[1:]
+        bboxes = ndimage.find_objects(labels, max_label=num)
+        return areas, bboxes
+    
+    def _skeletonize_in_bbox(self, mask):
+        """
+        只在前景的外接框内做骨架化，减少对背景体素的扫描
+        
+        参数：
+        mask: 布尔掩膜
+        
+        返回：
+        与mask同形状的布尔骨架
+        """
+        skeleton = np.zeros(mask.shape, dtype=bool)
+        slices = ndimage.find_objects(mask.view(np.uint8))
+        if not slices:
+            return skeleton
+        skeleton[slices[0]] = morphology.skeletonize(mask[slices[0]])
+        return skeleton
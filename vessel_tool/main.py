@@ -5,53 +5,79 @@
 
 import os
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import scipy.ndimage
 from typing import Union
 from .base import VesselBase
-from .tree import VesselTree
+from .tree import VesselTree, VesselTreeSoA
 from .visualization import VesselVisualizer
 
+# 可选的文件格式库，首次读取对应格式时才导入，之后复用模块对象
+_nrrd = None
+_nibabel = None
+
+
+def _get_nrrd():
+    global _nrrd
+    if _nrrd is None:
+        import nrrd
+        _nrrd = nrrd
+    return _nrrd
+
+
+def _get_nibabel():
+    global _nibabel
+    if _nibabel is None:
+        import nibabel
+        _nibabel = nibabel
+    return _nibabel
+
 
 class VesselProcessor:
     """血管处理主类，提供完整的肝脏血管三维重建流程"""
     
-    def __init__(self, temp_folder='./tmp'):
+    def __init__(self, temp_folder='./tmp', cache_inputs=False, input_cache_size=4):
         """
         初始化血管处理器
         
         参数：
         temp_folder: 临时文件夹路径
+        cache_inputs: 是否缓存 read_data 的读取结果，同一输入重复处理时跳过DICOM读取
+        input_cache_size: 输入缓存的最大条目数
         """
         self.temp_folder = temp_folder
         self.base = VesselBase()
         self.tree = VesselTree() 
         self.visualizer = VesselVisualizer()
+        self.cache_inputs = cache_inputs
+        self.input_cache_size = input_cache_size
+        self._input_cache = OrderedDict()
         
         # 确保临时文件夹存在
         os.makedirs(temp_folder, exist_ok=True)
     
-    def read_file(self, filename):
+    def read_file(self, filename, mmap=True):
         """
         读取各种格式的医学图像文件
         
         参数：
         filename: 文件路径
+        mmap: 对 .npy 文件使用只读内存映射，避免一次性载入整个数组；
+              需要原地修改时调用方应先 np.array(arr) 复制
         
         返回：
         图像数据数组
         """
         try:
             if filename.endswith('.nrrd'):
-                import nrrd
-                img_data, header = nrrd.read(filename)
+                img_data, header = _get_nrrd().read(filename)
                 return img_data
             elif filename.endswith('.nii.gz') or filename.endswith('.nii'):
-                import nibabel as nib
-                img_data = nib.load(filename)
+                img_data = _get_nibabel().load(filename)
                 return img_data.get_fdata()
             elif filename.endswith('.npy'):
-                return np.load(filename)
+                return np.load(filename, mmap_mode='r' if mmap else None)
             else:
                 raise ValueError(f"不支持的文件格式: {filename}")
         except Exception as e:
@@ -69,9 +95,18 @@ class VesselProcessor:
         
         返回：
         tuple: (原始图像, 缩放因子, 分割结果, 肝门边界框, 像素间距, 原点, 方向矩阵)
+               启用 cache_inputs 时，命中缓存返回的是共享的数组，调用方不应原地修改
         """
+        if self.cache_inputs:
+            key = self._input_cache_key(dcm_folder, seg_result_path, hilum_box_file)
+            if key in self._input_cache:
+                self._input_cache.move_to_end(key)
+                return self._input_cache[key]
+        
         print("正在读取DICOM数据...")
-        volume_image, spacing, origin, direction = self.base.load_dicom_series_as_3d_array(dcm_folder)
+        volume_image, spacing, origin, direction = self.base.load_dicom_series_as_3d_array(
+            dcm_folder, parallel=True
+        )
         
         print("正在读取分割结果...")
         zoom_factors = (512/volume_image.shape[0], 512/volume_image.shape[1], 1)
@@ -83,9 +118,33 @@ class VesselProcessor:
         else:
             hilum_box = np.array([[0, 512], [0, 512], [0, 512]])
         
-        res_data = scipy.ndimage.zoom(res_data, zoom_factors, order=0)
+        res_data = self.base.nearest_zoom(res_data, zoom_factors)
+        
+        result = (volume_image, zoom_factors, res_data, hilum_box, spacing, origin, direction)
+        if self.cache_inputs:
+            self._input_cache[key] = result
+            while len(self._input_cache) > self.input_cache_size:
+                self._input_cache.popitem(last=False)
+        
+        return result
+    
+    def _input_cache_key(self, *paths):
+        """
+        由输入路径及其修改时间生成缓存键，文件更新后缓存自动失效
         
-        return volume_image, zoom_factors, res_data, hilum_box, spacing, origin, direction
+        参数：
+        paths: 输入文件或文件夹路径，可为None
+        
+        返回：
+        缓存键元组
+        """
+        key = []
+        for path in paths:
+            if path is None:
+                key.append(None)
+            else:
+                key.append((os.path.abspath(path), os.stat(path).st_mtime_ns))
+        return tuple(key)
     
     def get_hilum_structures(self, res_data, hilum_box):
         """
@@ -99,7 +158,8 @@ class VesselProcessor:
         平滑的肝门结构STL
         """
         print("正在处理肝门区域...")
-        big_artery = np.where(res_data == 1, 1, 0)
+        # 直接输出uint8掩膜，与后续vtk图像的标量类型一致，避免int64临时数组
+        big_artery = np.equal(res_data, 1, out=np.empty(res_data.shape, dtype=np.uint8), casting='unsafe')
         middle_region = 20
         offset = 15
         
@@ -115,7 +175,7 @@ class VesselProcessor:
         获取平滑的最大连通组件STL
         
         参数：
-        data: 输入数据
+        data: 输入数据，非零体素视为前景；不会被修改
         hilum_box: 肝门边界框
         middle_region: 中间区域大小
         offset: 偏移量
@@ -123,16 +183,17 @@ class VesselProcessor:
         返回：
         平滑的STL网格
         """
-        # 限制处理区域
-        data[:max(1, hilum_box[0][0]-middle_region), :, :] = 0
-        data[min(hilum_box[0][1]+middle_region, 511):, :, :] = 0
-        data[:, :max(hilum_box[1][0]-middle_region, 1), :] = 0
-        data[:, min(hilum_box[1][1]+middle_region, 511):, :] = 0
-        data[:, :, :max(hilum_box[2][0]-middle_region-offset, 1)] = 0
-        data[:, :, min(511, hilum_box[2][1]+middle_region-offset):] = 0
-        
-        # 获取最大连通组件
-        data, box = self.base.retain_largest_connected_component(data)
+        # 限制处理区域：范围外全部为0，连通域标记只需在范围内的子数组上进行，
+        # 结果与在整个体数据上标记一致；前景复制为C连续uint8数组，不修改调用方的数组
+        roi = (slice(max(1, hilum_box[0][0]-middle_region), min(hilum_box[0][1]+middle_region, 511)),
+               slice(max(hilum_box[1][0]-middle_region, 1), min(hilum_box[1][1]+middle_region, 511)),
+               slice(max(hilum_box[2][0]-middle_region-offset, 1), min(511, hilum_box[2][1]+middle_region-offset)))
+        cropped = np.ascontiguousarray(data[roi] != 0).view(np.uint8)
+        
+        # 获取最大连通组件，再放回原尺寸的体数据中
+        largest, box = self.base.retain_largest_connected_component(cropped)
+        data = np.zeros(data.shape, dtype=np.uint8)
+        data[roi] = largest
         
         # 转换为VTK格式并提取表面
         vtk_image = self.visualizer.numpy_to_vtk_image(data)
@@ -157,7 +218,7 @@ class VesselProcessor:
         print("正在构建血管树结构...")
         
         # 获取连通组件
-        bigger_regions, smaller_regions = self.base.retain_connected_component_list(data, 1)
+        bigger_regions, smaller_regions, _, _, _ = self.base.retain_connected_component_list(data, 1, keep_small=False)
         
         if not bigger_regions:
             raise ValueError("未找到足够大的血管连通组件")
@@ -237,6 +298,9 @@ class VesselProcessor:
                 spacing, origin, direction, zoom_factors
             )
             
+            # 一次遍历得到树的统计信息；statistics 中根节点深度为0，这里按层数计
+            stats = self.visualize_tree_statistics(main_tree)
+            
             end_time = time.time()
             processing_time = end_time - start_time
             
@@ -246,7 +310,8 @@ class VesselProcessor:
                 'output_file': output_path,
                 'tree_info': {
                     'total_branches': len(main_tree.get('subtree', [])),
-                    'max_depth': self._calculate_tree_depth(main_tree)
+                    'max_depth': stats['max_depth'] + 1,
+                    'total_points': stats['total_points']
                 }
             }
             
@@ -263,25 +328,77 @@ class VesselProcessor:
                 'processing_time': time.time() - start_time
             }
     
-    def _calculate_tree_depth(self, tree):
+    def process_batch(self, configs, max_workers=None, batch_size=1):
         """
-        计算树的深度
+        批量处理，各病例相互独立，可分发到进程池并行执行
         
         参数：
-        tree: 血管树结构
+        configs: 配置字典的可迭代对象，格式同 process_complete_pipeline
+        max_workers: 进程数，默认为 min(任务数, CPU核数)
+        batch_size: 多进程时每次提交给工作进程的任务数
         
         返回：
-        树的最大深度
+        list: 按输入顺序排列的各任务处理结果
+        """
+        return list(self.iter_batch(configs, max_workers, batch_size))
+    
+    def iter_batch(self, configs, max_workers=None, batch_size=1):
         """
-        if not tree.get('subtree'):
-            return 1
+        批量处理，按输入顺序逐个产出各任务的处理结果
         
-        max_depth = 0
-        for subtree in tree['subtree']:
-            depth = self._calculate_tree_depth(subtree)
-            max_depth = max(max_depth, depth)
+        参数：
+        configs: 配置字典的可迭代对象，可以是边读取边产出配置的生成器
+        max_workers: 进程数，默认为 min(任务数, CPU核数)；为1时在当前进程中依次处理，大于1时分发到进程池
+        batch_size: 多进程时每次提交给工作进程的任务数
         
-        return max_depth + 1
+        返回：
+        生成器，按输入顺序产出处理结果，每产出一个结果打印一行进度；读取 configs 出错时
+        取消尚未开始的任务，先产出已完成任务的结果，再抛出该异常
+        """
+        for i, result in enumerate(self._iter_batch_results(configs, max_workers, batch_size), 1):
+            status = '成功' if result['success'] else '失败'
+            print(f"批量处理进度: 第 {i} 个任务已完成（{status}）")
+            yield result
+    
+    def _iter_batch_results(self, configs, max_workers, batch_size):
+        """按输入顺序产出批量任务的处理结果，参数同 iter_batch"""
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+            if hasattr(configs, '__len__'):
+                max_workers = min(max_workers, max(1, len(configs)))
+        
+        if max_workers <= 1:
+            for config in configs:
+                yield self.process_complete_pipeline(config)
+            return
+        
+        batch_size = max(1, batch_size)
+        initargs = (type(self), self.temp_folder, self.cache_inputs, self.input_cache_size)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker,
+                                 initargs=initargs) as executor:
+            # 边读取配置边提交，每 batch_size 个任务打包提交一次
+            futures = []
+            chunk = []
+            try:
+                for config in configs:
+                    chunk.append(config)
+                    if len(chunk) == batch_size:
+                        futures.append(executor.submit(_run_batch_tasks, chunk))
+                        chunk = []
+                if chunk:
+                    futures.append(executor.submit(_run_batch_tasks, chunk))
+            except Exception:
+                # 配置读取失败：取消排队中的任务，等正在执行的任务结束，返回已完成的结果后再抛出
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for future in futures:
+                    if not future.cancelled():
+                        yield from future.result()
+                raise
+            
+            for future in futures:
+                yield from future.result()
     
     def visualize_tree_statistics(self, tree):
         """
@@ -293,24 +410,23 @@ class VesselProcessor:
         返回：
         统计信息字典
         """
-        stats = {
-            'total_points': 0,
-            'total_branches': 0,
-            'max_depth': 0,
-            'average_branch_length': 0
-        }
-        
-        def count_tree_stats(node, depth=0):
-            stats['total_points'] += len(node.get('line', []))
-            stats['total_branches'] += 1
-            stats['max_depth'] = max(stats['max_depth'], depth)
-            
-            for subtree in node.get('subtree', []):
-                count_tree_stats(subtree, depth + 1)
-        
-        count_tree_stats(tree)
-        
-        if stats['total_branches'] > 0:
-            stats['average_branch_length'] = stats['total_points'] / stats['total_branches']
-        
-        return stats 
\ No newline at end of file
+        return VesselTreeSoA.from_dict(tree).statistics()
+
+
+# 批量处理工作进程中复用的处理器实例
+_batch_processor = None
+
+
+def _init_batch_worker(processor_cls, temp_folder, cache_inputs, input_cache_size):
+    """在工作进程启动时创建处理器，同一进程处理的任务共用其输入缓存"""
+    global _batch_processor
+    _batch_processor = processor_cls(
+        temp_folder=temp_folder,
+        cache_inputs=cache_inputs,
+        input_cache_size=input_cache_size
+    )
+
+
+def _run_batch_tasks(configs):
+    """在工作进程中依次处理一组任务配置"""
+    return [_batch_processor.process_complete_pipeline(config) for config in configs]
@@ -4,10 +4,225 @@
 """
 
 import numpy as np
-import copy
 from collections import deque
 from .base import VesselBase
 
+# 26邻域偏移，按面、棱、角的顺序排列：BFS中第一个被访问的邻居延续当前等级，
+# 其余邻居等级加一，因此这里的顺序决定分级结果，不能改为笛卡尔积顺序
+_DIRS_26 = np.array([(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1),
+                     (-1, -1, 0), (-1, 1, 0), (1, -1, 0), (1, 1, 0), (-1, 0, -1), (-1, 0, 1),
+                     (1, 0, -1), (1, 0, 1), (0, -1, -1), (0, -1, 1), (0, 1, -1), (0, 1, 1),
+                     (-1, -1, -1), (-1, -1, 1), (-1, 1, -1), (-1, 1, 1), (1, -1, -1), (1, 1, -1),
+                     (1, -1, 1), (1, 1, 1)], dtype=np.int8)
+
+
+class VesselTreeSoA:
+    """
+    血管树的数组结构（Struct-of-Arrays）表示
+    
+    节点按先序排列（父节点总在子节点之前），所有节点的中心线点连续存放，
+    遍历和统计只需线性扫描数组，不再逐层访问嵌套字典。
+    
+    属性：
+    points: (N, 3) float32，所有节点中心线点坐标，按节点顺序拼接；由 from_dict 构建时首次访问才读取
+    priors: (N, 3) float32，每个点的前一个点坐标；同上
+    line_offsets: (M+1,) int32，节点i的点为 points[line_offsets[i]:line_offsets[i+1]]
+    parent: (M,) int32，父节点编号，根节点为-1
+    children_offsets: (M+1,) int32，节点i的子节点为 children_ids[children_offsets[i]:children_offsets[i+1]]
+    children_ids: (M-1,) int32，按父节点分组的子节点编号
+    divide_index: (M,) int32，节点在父节点中心线上的分岔点索引，根节点为-1
+    layer: (M,) int32，节点层级
+    depth: (M,) int32，节点到根节点的距离，根节点为0
+    """
+    
+    def __init__(self, line_offsets, parent, divide_index, layer, points=None, priors=None):
+        self._points = None if points is None else np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        self._priors = None if priors is None else np.asarray(priors, dtype=np.float32).reshape(-1, 3)
+        self.line_offsets = np.asarray(line_offsets, dtype=np.int32)
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.divide_index = np.asarray(divide_index, dtype=np.int32)
+        self.layer = np.asarray(layer, dtype=np.int32)
+        
+        # 按父节点分组构建子节点索引（稳定排序保持子节点原有顺序）
+        num_nodes = len(self.parent)
+        child_parent = self.parent[1:]
+        self.children_ids = (np.argsort(child_parent, kind='stable') + 1).astype(np.int32)
+        self.children_offsets = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(child_parent, minlength=num_nodes), out=self.children_offsets[1:])
+        
+        # 先序排列下父节点先于子节点，一次顺序扫描即可得到深度
+        depth = [0] * num_nodes
+        for i, p in enumerate(self.parent.tolist()[1:], 1):
+            depth[i] = depth[p] + 1
+        self.depth = np.asarray(depth, dtype=np.int32)
+        
+        # assign_depth 的结果：每个节点子树的深度和最长路径长度
+        self.deep = None
+        self.sub_length = None
+        # 由 from_dict 构建时保留原字典节点的引用，用于回写
+        self.nodes = None
+    
+    @property
+    def num_nodes(self):
+        return len(self.parent)
+    
+    @property
+    def points(self):
+        if self._points is None:
+            self._load_points()
+        return self._points
+    
+    @property
+    def priors(self):
+        if self._priors is None:
+            self._load_points()
+        return self._priors
+    
+    def _load_points(self):
+        """从 from_dict 保留的原字典节点中读取全部中心线点及其前一个点"""
+        points, priors = [], []
+        for node in self.nodes:
+            for p in node.get('line', []):
+                # 线条元素为 (坐标, 前一个点)，也兼容直接存放坐标的情况
+                if np.isscalar(p[0]):
+                    points.append(p)
+                    priors.append((0, 0, 0))
+                else:
+                    points.append(p[0])
+                    priors.append(p[1])
+        self._points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        self._priors = np.asarray(priors, dtype=np.float32).reshape(-1, 3)
+    
+    @classmethod
+    def from_dict(cls, blood_tree):
+        """
+        从字典形式的血管树构建数组结构；只读取树的结构和各节点的点数，
+        点坐标在首次访问 points / priors 时才读取
+        
+        参数：
+        blood_tree: 血管树结构
+        
+        返回：
+        VesselTreeSoA对象
+        """
+        nodes, parent, divide_index, layer = [], [], [], []
+        line_offsets = [0]
+        
+        stack = [(blood_tree, -1, -1)]
+        while stack:
+            node, par, div = stack.pop()
+            idx = len(nodes)
+            nodes.append(node)
+            parent.append(par)
+            divide_index.append(div)
+            layer.append(node.get('layer', 0))
+            
+            line_offsets.append(line_offsets[-1] + len(node.get('line', [])))
+            
+            subtrees = node.get('subtree', [])
+            divide = node.get('dividePointIndex', [])
+            for i in range(len(subtrees) - 1, -1, -1):
+                stack.append((subtrees[i], idx, divide[i] if i < len(divide) else 0))
+        
+        soa = cls(line_offsets, parent, divide_index, layer)
+        soa.nodes = nodes
+        return soa
+    
+    def to_dict(self):
+        """
+        转换回字典形式的血管树
+        
+        返回：
+        血管树结构，线条元素为 (坐标, 前一个点) 的浮点元组
+        """
+        points = [tuple(p) for p in self.points.tolist()]
+        priors = [tuple(p) for p in self.priors.tolist()]
+        offsets = self.line_offsets.tolist()
+        layer = self.layer.tolist()
+        
+        nodes = [
+            {
+                "line": list(zip(points[offsets[i]:offsets[i + 1]], priors[offsets[i]:offsets[i + 1]])),
+                "subtree": [],
+                "deep": [],
+                "subLength": [],
+                "dividePointIndex": [],
+                "layer": layer[i],
+            }
+            for i in range(self.num_nodes)
+        ]
+        
+        divide_index = self.divide_index.tolist()
+        deep = self.deep.tolist() if self.deep is not None else None
+        sub_length = self.sub_length.tolist() if self.sub_length is not None else None
+        for c, p in enumerate(self.parent.tolist()[1:], 1):
+            nodes[p]['subtree'].append(nodes[c])
+            nodes[p]['dividePointIndex'].append(divide_index[c])
+            if deep is not None:
+                nodes[p]['deep'].append(deep[c])
+                nodes[p]['subLength'].append(sub_length[c])
+        
+        return nodes[0]
+    
+    def assign_depth(self):
+        """
+        按后序计算每个节点子树的深度和最长路径长度，结果存入 deep 和 sub_length
+        
+        返回：
+        tuple: (根节点的最大深度, 最大长度)
+        """
+        num_nodes = self.num_nodes
+        line_length = np.diff(self.line_offsets).tolist()
+        divide_index = self.divide_index.tolist()
+        offsets = self.children_offsets.tolist()
+        children = self.children_ids.tolist()
+        
+        deep = [1] * num_nodes
+        length = [0] * num_nodes
+        # 先序的逆序即为后序：处理节点时其所有子节点都已完成
+        for i in range(num_nodes - 1, -1, -1):
+            max_deep = 0
+            max_length = 0
+            max_length_ind = 0
+            for c in children[offsets[i]:offsets[i + 1]]:
+                max_deep = max(deep[c], max_deep)
+                if length[c] > max_length:
+                    max_length = length[c]
+                    max_length_ind = divide_index[c]
+            deep[i] = max_deep + 1
+            length[i] = max_length + max(line_length[i] - max_length_ind, 0)
+        
+        self.deep = np.asarray(deep, dtype=np.int32)
+        self.sub_length = np.asarray(length, dtype=np.int64)
+        return deep[0], length[0]
+    
+    def write_depth_to_dict(self):
+        """
+        将 assign_depth 的结果追加回原字典节点的 deep 和 subLength 字段
+        """
+        deep = self.deep.tolist()
+        sub_length = self.sub_length.tolist()
+        for c, p in enumerate(self.parent.tolist()[1:], 1):
+            node = self.nodes[p]
+            node.setdefault('deep', []).append(deep[c])
+            node.setdefault('subLength', []).append(sub_length[c])
+    
+    def statistics(self):
+        """
+        统计树的点数、分支数和最大深度
+        
+        返回：
+        统计信息字典
+        """
+        total_points = int(self.line_offsets[-1])
+        total_branches = self.num_nodes
+        return {
+            'total_points': total_points,
+            'total_branches': total_branches,
+            'max_depth': int(self.depth.max()),
+            'average_branch_length': total_points / total_branches
+        }
+
 
 class VesselTree(VesselBase):
     """血管树处理类，负责血管树的构建和分析"""
@@ -26,37 +241,66 @@ class VesselTree(VesselBase):
         返回：
         tuple: (分级数组, 线段字典)
         """
-        directions = [(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), 
-                      (0, 0, 1), (-1, -1, 0), (-1, 1, 0), (1, -1, 0), (1, 1, 0),
-                      (-1, 0, -1), (-1, 0, 1), (1, 0, -1), (1, 0, 1), (0, -1, -1),
-                      (0, -1, 1), (0, 1, -1), (0, 1, 1), (-1, -1, -1), (-1, -1, 1),
-                      (-1, 1, -1), (-1, 1, 1), (1, -1, -1), (1, 1, -1), (1, -1, 1), (1, 1, 1)]
-        
-        grades = np.zeros(vessel_data.shape)
-        queue = deque([(start_point, 1, (-1, -1, -1))])  # (位置, 等级, 前一个点)
-        grades[start_point[0], start_point[1], start_point[2]] = 1
-        point_list_with_prior = {}
-        
-        while queue:
-            (x, y, z), current_grade, (px, py, pz) = queue.popleft()
+        # 外围补一圈0后按一维索引遍历，邻居只需加固定偏移，无需逐个做边界检查；
+        # 可访问标记存放在uint8数组中，访问后清零，替代对grades的查询
+        padded = np.zeros(tuple(n + 2 for n in vessel_data.shape), dtype=np.uint8)
+        padded[1:-1, 1:-1, 1:-1] = vessel_data == 1
+        stride_x, stride_y = padded.shape[1] * padded.shape[2], padded.shape[2]
+        offsets = (_DIRS_26.astype(np.intp) @ (stride_x, stride_y, 1)).tolist()
+        available = memoryview(padded.reshape(-1))
+        
+        start = ((int(start_point[0]) + 1) * stride_x + (int(start_point[1]) + 1) * stride_y
+                 + int(start_point[2]) + 1)
+        available[start] = 0
+        
+        # 按前景体素数（加上起点）一次性分配队列，visited_* 同时记录每个新访问点的
+        # (索引, 等级, 父节点在队列中的位置)；通过memoryview按下标读写，避免列表扩容
+        n = int(np.count_nonzero(padded)) + 1
+        visited_idx = np.empty(n, dtype=np.intp)
+        visited_grade = np.empty(n, dtype=np.int32)
+        visited_prior = np.empty(n, dtype=np.intp)
+        queue_idx = memoryview(visited_idx)
+        queue_grade = memoryview(visited_grade)
+        queue_prior = memoryview(visited_prior)
+        queue_idx[0], queue_grade[0], queue_prior[0] = start, 1, 0
+        head = 0
+        count = 1
+        while head < count:
+            idx = queue_idx[head]
+            current_grade = queue_grade[head]
+            parent = head
+            head += 1
             connections = 0
             
-            for dx, dy, dz in directions:
-                nx, ny, nz = x + dx, y + dy, z + dz
-                if (0 <= nx < vessel_data.shape[0] and 
-                    0 <= ny < vessel_data.shape[1] and 
-                    0 <= nz < vessel_data.shape[2]):
-                    
-                    if vessel_data[nx, ny, nz] == 1 and grades[nx, ny, nz] == 0:
-                        connections += 1
-                        new_grade = current_grade + 1 if connections > 1 else current_grade
-                        
-                        grades[nx, ny, nz] = new_grade
-                        queue.append(((nx, ny, nz), new_grade, (x, y, z)))
-                        
-                        if new_grade not in point_list_with_prior:
-                            point_list_with_prior[new_grade] = []
-                        point_list_with_prior[new_grade].append(((nx, ny, nz), (x, y, z)))
+            for off in offsets:
+                nidx = idx + off
+                if available[nidx]:
+                    available[nidx] = 0
+                    connections += 1
+                    queue_idx[count] = nidx
+                    queue_grade[count] = current_grade + 1 if connections > 1 else current_grade
+                    queue_prior[count] = parent
+                    count += 1
+        
+        # 一次性将一维索引还原为坐标，得到扁平的 (子节点坐标, 父节点坐标, 等级) 数组
+        coords = np.stack(np.unravel_index(visited_idx[:count], padded.shape), axis=1) - 1
+        grade_of = visited_grade[:count]
+        grades = np.zeros(vessel_data.shape)
+        grades[coords[:, 0], coords[:, 1], coords[:, 2]] = grade_of
+        
+        # 起点没有前一个点，不参与线段构建；其余点按等级稳定排序后分组，组内保持遍历顺序
+        child_coords = coords[1:]
+        parent_coords = coords[visited_prior[1:count]]
+        grade_of = grade_of[1:]
+        order = np.argsort(grade_of, kind='stable')
+        keys, first = np.unique(grade_of[order], return_index=True)
+        bounds = np.append(first, len(order))
+        child_coords = list(map(tuple, child_coords[order].tolist()))
+        parent_coords = list(map(tuple, parent_coords[order].tolist()))
+        
+        point_list_with_prior = {}
+        for k, lo, hi in zip(keys.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()):
+            point_list_with_prior[k] = list(zip(child_coords[lo:hi], parent_coords[lo:hi]))
         
         seg_dic = self._get_all_segments(point_list_with_prior)
         return grades, seg_dic
@@ -73,41 +317,44 @@ class VesselTree(VesselBase):
         """
         seg_dic = {}
         
-        for k in point_list_with_prior:
-            readed = [0] * len(point_list_with_prior[k])
+        for k, pairs in point_list_with_prior.items():
+            # 子节点坐标在BFS中唯一，同一等级下每个点至多有一个同级子节点，
+            # 因此两端的延伸都可由字典一次查到，取代对整个列表的反复扫描
+            by_child = {}
+            by_parent = {}
+            for i, (point, prior) in enumerate(pairs):
+                by_child.setdefault(point, i)
+                by_parent.setdefault(prior, i)
+            
+            used = bytearray(len(pairs))
             seg_num = 0
             seg_dic[k] = {}
-            find_flag = 0
-            
-            while sum(readed) < len(point_list_with_prior[k]):
-                if find_flag != 1:
-                    seg_num += 1
-                    for i, point_pair in enumerate(point_list_with_prior[k]):
-                        if readed[i] == 1:
-                            continue
-                        seg_dic[k][seg_num] = deque([point_list_with_prior[k][i]])
-                        readed[i] = 1
-                        break
+            for i in range(len(pairs)):
+                if used[i]:
+                    continue
+                used[i] = 1
+                seg_num += 1
+                seg = deque([pairs[i]])
+                
+                # 向前一个点方向延伸
+                j = by_child.get(seg[-1][1])
+                while j is not None and not used[j]:
+                    used[j] = 1
+                    seg.append(pairs[j])
+                    j = by_child.get(pairs[j][1])
+                
+                # 向后续点方向延伸
+                j = by_parent.get(seg[0][0])
+                while j is not None and not used[j]:
+                    used[j] = 1
+                    seg.appendleft(pairs[j])
+                    j = by_parent.get(pairs[j][0])
                 
-                find_flag = 0
-                for i, point_pair in enumerate(point_list_with_prior[k]):
-                    if readed[i] == 1:
-                        continue
-                    
-                    if point_pair[0] == seg_dic[k][seg_num][-1][1]:
-                        seg_dic[k][seg_num].append(point_pair)
-                        find_flag = 1
-                        readed[i] = 1
-                        break
-                    elif point_pair[1] == seg_dic[k][seg_num][0][0]:
-                        seg_dic[k][seg_num].appendleft(point_pair)
-                        find_flag = 1
-                        readed[i] = 1
-                        break
+                seg_dic[k][seg_num] = seg
         
         return seg_dic
     
-    def build_tree_structure(self, blood_tree, layer, seg_dic, find_dad):
+    def build_tree_structure(self, blood_tree, layer, seg_dic, start_to_segs=None):
         """
         递归构建树结构
         
@@ -115,31 +362,35 @@ class VesselTree(VesselBase):
         blood_tree: 血管树结构
         layer: 当前层级
         seg_dic: 线段字典
-        find_dad: 父节点查找标记
+        start_to_segs: 线段起点（末端的前一个点）到线段编号的索引，为None时由seg_dic构建；
+                       已挂接的线段会从中弹出
         """
-        for i in seg_dic:
-            for j in seg_dic[i]:
-                for k, point in enumerate(blood_tree['line']):
-                    try:
-                        if (tuple(seg_dic[i][j][-1][1]) == tuple(point[0]) and 
-                            find_dad[i][j] == 0):
-                            
-                            new_tree = {
-                                "line": list(seg_dic[i][j]),
-                                "subtree": [],
-                                "deep": [],
-                                "subLength": [],
-                                "dividePointIndex": [],
-                                "layer": layer,
-                            }
-                            
-                            find_dad[i][j] = 1
-                            blood_tree['subtree'].append(new_tree)
-                            blood_tree['dividePointIndex'].append(k)
-                            
-                            self.build_tree_structure(new_tree, layer + 1, seg_dic, find_dad)
-                    except Exception as e:
-                        print(f"树构建错误: {e}")
+        if start_to_segs is None:
+            start_to_segs = {}
+            for rank, (i, j) in enumerate((i, j) for i in seg_dic for j in seg_dic[i]):
+                start_to_segs.setdefault(tuple(seg_dic[i][j][-1][1]), []).append((rank, i, j))
+        
+        # 按线段字典中的顺序挂接子树，与逐个线段比对中心线时的顺序一致
+        matches = []
+        for k, point in enumerate(blood_tree['line']):
+            for rank, i, j in start_to_segs.pop(tuple(point[0]), ()):
+                matches.append((rank, k, i, j))
+        matches.sort()
+        
+        for _, k, i, j in matches:
+            new_tree = {
+                "line": list(seg_dic[i][j]),
+                "subtree": [],
+                "deep": [],
+                "subLength": [],
+                "dividePointIndex": [],
+                "layer": layer,
+            }
+            
+            blood_tree['subtree'].append(new_tree)
+            blood_tree['dividePointIndex'].append(k)
+            
+            self.build_tree_structure(new_tree, layer + 1, seg_dic, start_to_segs)
     
     def assign_depth(self, blood_tree):
         """
@@ -151,23 +402,10 @@ class VesselTree(VesselBase):
         返回：
         tuple: (最大深度, 最大长度)
         """
-        max_deep = 0
-        max_length = 0
-        max_length_ind = 0
-        
-        for i, subt in enumerate(blood_tree['subtree']):
-            sb_deep, sb_length = self.assign_depth(subt)
-            index = blood_tree['dividePointIndex'][i]
-            
-            max_deep = max(sb_deep, max_deep)
-            if sb_length > max_length:
-                max_length = sb_length
-                max_length_ind = index
-            
-            blood_tree['deep'].append(sb_deep)
-            blood_tree['subLength'].append(sb_length)
-        
-        return max_deep + 1, max_length + len(list(blood_tree['line'])[max_length_ind:])
+        soa = VesselTreeSoA.from_dict(blood_tree)
+        result = soa.assign_depth()
+        soa.write_depth_to_dict()
+        return result
     
     def find_longest_line(self, blood_tree):
         """
@@ -179,17 +417,22 @@ class VesselTree(VesselBase):
         返回：
         最长路径的点集
         """
-        if len(blood_tree['line']) > 0 and len(blood_tree['subtree']) > 0:
+        # 沿最长子树逐层向下，最长路径为叶节点中心线接上各层分岔点之后的中心线
+        pieces = []
+        node = blood_tree
+        while len(node['line']) > 0 and len(node['subtree']) > 0:
             try:
-                index = np.argmax(blood_tree['subLength'])
-                new_line = (self.find_longest_line(blood_tree['subtree'][index]) + 
-                           copy.deepcopy(blood_tree['line'][blood_tree['dividePointIndex'][index]:]))
-                return new_line
+                index = np.argmax(node['subLength'])
+                pieces.append(node['line'][node['dividePointIndex'][index]:])
+                node = node['subtree'][index]
             except Exception as e:
                 print(f'查找最长路径错误: {e}')
                 raise
-        else:
-            return copy.deepcopy(blood_tree['line'])
+        
+        new_line = list(node['line'])
+        for piece in reversed(pieces):
+            new_line += piece
+        return new_line
     
     def find_small_branches(self, blood_tree):
         """
@@ -199,57 +442,55 @@ class VesselTree(VesselBase):
         blood_tree: 血管树结构
         
         返回：
-        小分支列表
+        小分支列表，其中的子树直接引用原树的节点（只读，不做深拷贝）
         """
         branches = []
         
-        if len(blood_tree['subtree']) == 0:
-            return branches
-        
-        max_length_ind = np.argmax(blood_tree['subLength'])
-        
-        if blood_tree["dividePointIndex"][max_length_ind] == 0:
-            for i in range(len(blood_tree["dividePointIndex"])):
-                if i != max_length_ind:
-                    branches.append({
-                        'branch': copy.deepcopy(blood_tree['subtree'][i]),
-                        'dividePointIndex': (blood_tree['subLength'][max_length_ind] + 
-                                           blood_tree["dividePointIndex"][i] - 
-                                           blood_tree["dividePointIndex"][max_length_ind])
-                    })
-            
-            return branches + self.find_small_branches(blood_tree['subtree'][max_length_ind])
-        
-        if blood_tree["dividePointIndex"][max_length_ind] >= 1:
-            new_tree = {
-                "line": copy.deepcopy(blood_tree['line'][:blood_tree["dividePointIndex"][max_length_ind]]),
-                "subtree": [],
-                "deep": [],
-                "subLength": [],
-                "dividePointIndex": [],
-                "layer": 999,
-            }
-            
-            for i in range(len(blood_tree["dividePointIndex"])):
-                if blood_tree["dividePointIndex"][i] < blood_tree["dividePointIndex"][max_length_ind]:
-                    new_tree['subtree'].append(copy.deepcopy(blood_tree['subtree'][i]))
-                    new_tree['dividePointIndex'].append(blood_tree["dividePointIndex"][i])
-                    new_tree['subLength'].append(blood_tree['subLength'][i])
-                elif (blood_tree["dividePointIndex"][i] >= blood_tree["dividePointIndex"][max_length_ind] 
-                      and i != max_length_ind):
-                    branches.append({
-                        'branch': copy.deepcopy(blood_tree['subtree'][i]),
-                        'dividePointIndex': (blood_tree['subLength'][max_length_ind] + 
-                                           blood_tree["dividePointIndex"][i] - 
-                                           blood_tree["dividePointIndex"][max_length_ind])
-                    })
+        # 沿最长子树逐层向下，收集每一层除最长子树外的分支
+        while len(blood_tree['subtree']) > 0:
+            max_length_ind = np.argmax(blood_tree['subLength'])
             
-            branches.append({
-                'branch': new_tree,
-                'dividePointIndex': blood_tree['subLength'][max_length_ind]
-            })
+            if blood_tree["dividePointIndex"][max_length_ind] == 0:
+                for i in range(len(blood_tree["dividePointIndex"])):
+                    if i != max_length_ind:
+                        branches.append({
+                            'branch': blood_tree['subtree'][i],
+                            'dividePointIndex': (blood_tree['subLength'][max_length_ind] + 
+                                               blood_tree["dividePointIndex"][i] - 
+                                               blood_tree["dividePointIndex"][max_length_ind])
+                        })
+            else:
+                new_tree = {
+                    "line": blood_tree['line'][:blood_tree["dividePointIndex"][max_length_ind]],
+                    "subtree": [],
+                    "deep": [],
+                    "subLength": [],
+                    "dividePointIndex": [],
+                    "layer": 999,
+                }
+                
+                for i in range(len(blood_tree["dividePointIndex"])):
+                    if blood_tree["dividePointIndex"][i] < blood_tree["dividePointIndex"][max_length_ind]:
+                        new_tree['subtree'].append(blood_tree['subtree'][i])
+                        new_tree['dividePointIndex'].append(blood_tree["dividePointIndex"][i])
+                        new_tree['subLength'].append(blood_tree['subLength'][i])
+                    elif (blood_tree["dividePointIndex"][i] >= blood_tree["dividePointIndex"][max_length_ind] 
+                          and i != max_length_ind):
+                        branches.append({
+                            'branch': blood_tree['subtree'][i],
+                            'dividePointIndex': (blood_tree['subLength'][max_length_ind] + 
+                                               blood_tree["dividePointIndex"][i] - 
+                                               blood_tree["dividePointIndex"][max_length_ind])
+                        })
+                
+                branches.append({
+                    'branch': new_tree,
+                    'dividePointIndex': blood_tree['subLength'][max_length_ind]
+                })
             
-            return branches + self.find_small_branches(blood_tree['subtree'][max_length_ind])
+            blood_tree = blood_tree['subtree'][max_length_ind]
+        
+        return branches
     
     def create_new_tree_from_old(self, blood_tree):
         """
@@ -261,24 +502,30 @@ class VesselTree(VesselBase):
         返回：
         优化后的新树结构
         """
-        new_line = self.find_longest_line(blood_tree)
-        new_tree = {
-            "line": new_line,
-            "subtree": [],
-            "deep": [],
-            "subLength": [],
-            "dividePointIndex": [],
-            "layer": 0,
-        }
-        
-        branches = self.find_small_branches(blood_tree)
-        for br in branches:
-            new_tree['subtree'].append(self.create_new_tree_from_old(br['branch']))
-            new_tree["dividePointIndex"].append(br['dividePointIndex'])
-            if br['branch']['subLength']:
-                new_tree["subLength"].append(max(br['branch']['subLength']))
-        
-        return new_tree
+        # 显式栈代替递归；子树位置预先占好，保证与递归版本的子树顺序一致
+        root = [None]
+        stack = [(blood_tree, root, 0)]
+        while stack:
+            old_tree, slots, slot = stack.pop()
+            new_tree = {
+                "line": self.find_longest_line(old_tree),
+                "subtree": [],
+                "deep": [],
+                "subLength": [],
+                "dividePointIndex": [],
+                "layer": 0,
+            }
+            slots[slot] = new_tree
+            
+            branches = self.find_small_branches(old_tree)
+            new_tree['subtree'] = [None] * len(branches)
+            for i, br in enumerate(branches):
+                stack.append((br['branch'], new_tree['subtree'], i))
+                new_tree["dividePointIndex"].append(br['dividePointIndex'])
+                if br['branch']['subLength']:
+                    new_tree["subLength"].append(max(br['branch']['subLength']))
+        
+        return root[0]
     
     def empty_depth_info(self, blood_tree):
         """
@@ -287,9 +534,11 @@ class VesselTree(VesselBase):
         参数：
         blood_tree: 血管树结构
         """
-        blood_tree['subLength'] = []
-        for subt in blood_tree['subtree']:
-            self.empty_depth_info(subt)
+        stack = [blood_tree]
+        while stack:
+            node = stack.pop()
+            node['subLength'] = []
+            stack.extend(node['subtree'])
     
     def get_tree_from_region(self, data, center_middle, skeleton):
         """
@@ -320,15 +569,12 @@ class VesselTree(VesselBase):
             "layer": 0,
         }
         
-        skeleton_data = np.zeros(data.shape)
+        skeleton_data = np.zeros(data.shape, dtype=np.uint8)
         skeleton_data[sk_coords[:, 0], sk_coords[:, 1], sk_coords[:, 2]] = 1
         
         grades, seg_dic = self.label_vessel_grades(skeleton_data, most_recent_coord)
-        max_length = max([len(seg_dic[k]) for k in seg_dic.keys()])
-        find_dad = np.array([[0 for j in range(max_length + 3)] 
-                            for i in range(len(seg_dic.keys()) + 3)])
         
-        self.build_tree_structure(blood_tree, 0, seg_dic, find_dad)
+        self.build_tree_structure(blood_tree, 0, seg_dic)
         self.assign_depth(blood_tree)
         new_tree = self.create_new_tree_from_old(blood_tree)
         
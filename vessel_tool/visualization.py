@@ -5,9 +5,14 @@
 
 import numpy as np
 import vtk
+from vtk.util import numpy_support
 import copy
+import threading
 import time
-from stl import mesh
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from stl import mesh, Mode
 from .base import VesselBase
 
 
@@ -16,6 +21,43 @@ class VesselVisualizer(VesselBase):
     
     def __init__(self):
         super().__init__()
+        # 复用的VTK滤波器按线程缓存（render_vessel_tree 可在线程池中生成网格）
+        self._filter_cache = threading.local()
+    
+    def _get_filter(self, filter_cls):
+        """
+        取当前线程缓存的VTK滤波器，第一次使用时创建
+        
+        参数：
+        filter_cls: VTK滤波器类
+        
+        返回：
+        滤波器实例
+        """
+        filters = self._filter_cache.__dict__
+        vtk_filter = filters.get(filter_cls)
+        if vtk_filter is None:
+            vtk_filter = filters[filter_cls] = filter_cls()
+        return vtk_filter
+    
+    @staticmethod
+    def _run_filter(vtk_filter):
+        """
+        执行缓存的滤波器，把输出浅拷贝到新的网格中返回，并释放对输入的引用，
+        这样下一次调用不会改写已返回的结果
+        
+        参数：
+        vtk_filter: 已设置好输入和参数的滤波器
+        
+        返回：
+        输出网格
+        """
+        vtk_filter.Update()
+        output = vtk.vtkPolyData()
+        output.ShallowCopy(vtk_filter.GetOutput())
+        if vtk_filter.GetNumberOfInputPorts() > 0:
+            vtk_filter.RemoveAllInputs()
+        return output
     
     def numpy_to_vtk_image(self, data):
         """
@@ -29,68 +71,91 @@ class VesselVisualizer(VesselBase):
         """
         image = vtk.vtkImageData()
         image.SetDimensions(data.shape)
-        image.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
         
-        flat_data = np.transpose(data, (2, 1, 0)).ravel()
-        for i in range(len(flat_data)):
-            image.GetPointData().GetScalars().SetTuple1(i, flat_data[i])
+        # vtk按x变化最快的顺序存放体素，即NumPy的Fortran顺序；
+        # 展平后的数组直接作为标量缓冲区（不复制），由vtk数组持有其引用
+        flat_data = np.asarray(data).astype(np.uint8, copy=False).ravel(order='F')
+        scalars = numpy_support.numpy_to_vtk(flat_data, deep=False, array_type=vtk.VTK_UNSIGNED_CHAR)
+        image.GetPointData().SetScalars(scalars)
         
         return image
     
     def extract_surface(self, image):
         """
-        使用Marching Cubes算法提取表面
+        使用Flying Edges算法提取二值掩膜的表面
         
         参数：
-        image: vtkImageData对象
+        image: vtkImageData对象，体素值为0或1
         
         返回：
         提取的表面网格
         """
-        extractor = vtk.vtkDiscreteMarchingCubes()
+        # 输入为0/1掩膜，Flying Edges 取0.5等值面时顶点都落在边的中点，
+        # 与 vtkDiscreteMarchingCubes 提取值为1的表面得到相同的三角形，且可多线程执行
+        extractor = self._get_filter(vtk.vtkFlyingEdges3D)
         extractor.SetInputData(image)
-        extractor.GenerateValues(1, 1, 1)  # 提取值为1的表面
-        extractor.Update()
-        return extractor.GetOutput()
+        extractor.SetValue(0, 0.5)
+        extractor.ComputeNormalsOff()
+        extractor.ComputeGradientsOff()
+        extractor.ComputeScalarsOff()
+        return self._run_filter(extractor)
     
-    def smooth_mesh(self, polydata, iterations=15, relaxation_factor=0.1):
+    def smooth_mesh(self, polydata, iterations=15, relaxation_factor=None, pass_band=0.1):
         """
-        网格平滑处理
+        网格平滑处理（窗口sinc滤波，不像拉普拉斯平滑那样使细血管收缩）
+        
+        注意：输出与之前的拉普拉斯平滑（vtkSmoothPolyDataFilter）不等价，
+        平滑程度、顶点位置以及后续简化得到的三角形数量都会不同
         
         参数：
         polydata: 输入的网格数据
-        iterations: 平滑迭代次数
-        relaxation_factor: 松弛因子
+        iterations: 平滑迭代次数（滤波多项式的阶数）
+        relaxation_factor: 已弃用，仅为兼容旧调用保留；给出时按 pass_band = 0.001 / relaxation_factor
+                           近似换算并忽略 pass_band，该换算只是经验值
+        pass_band: 通带，取值 (0, 2]，越小平滑越强；默认 0.1 与 vtkWindowedSincPolyDataFilter 的默认值相同
         
         返回：
         平滑后的网格
         """
-        smoother = vtk.vtkSmoothPolyDataFilter()
+        if relaxation_factor is not None:
+            warnings.warn("smooth_mesh 的 relaxation_factor 参数已弃用，请改用 pass_band",
+                          DeprecationWarning, stacklevel=2)
+            pass_band = min(2.0, 0.001 / relaxation_factor) if relaxation_factor > 0 else 2.0
+        
+        smoother = self._get_filter(vtk.vtkWindowedSincPolyDataFilter)
         smoother.SetInputData(polydata)
         smoother.SetNumberOfIterations(iterations)
-        smoother.SetRelaxationFactor(relaxation_factor)
+        smoother.SetPassBand(pass_band)
         smoother.FeatureEdgeSmoothingOff()
         smoother.BoundarySmoothingOn()
-        smoother.Update()
-        return smoother.GetOutput()
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOn()
+        return self._run_filter(smoother)
     
-    def decimate_mesh(self, input_polydata, reduction_rate=0.95):
+    def decimate_mesh(self, input_polydata, reduction_rate=0.95, method='pro'):
         """
         网格简化
         
         参数：
         input_polydata: 输入网格
         reduction_rate: 简化比例
+        method: 'pro' 使用保持拓扑的 vtkDecimatePro（简化比例只是上限，细血管不会被删掉）；
+                'quadric' 使用 vtkQuadricDecimation，严格达到简化比例但不保持拓扑
         
         返回：
         简化后的网格
         """
-        decimator = vtk.vtkDecimatePro()
+        if method == 'pro':
+            decimator = self._get_filter(vtk.vtkDecimatePro)
+            decimator.PreserveTopologyOn()
+        elif method == 'quadric':
+            decimator = self._get_filter(vtk.vtkQuadricDecimation)
+            decimator.VolumePreservationOn()
+        else:
+            raise ValueError(f"不支持的简化方法: {method}")
         decimator.SetInputData(input_polydata)
         decimator.SetTargetReduction(reduction_rate)
-        decimator.PreserveTopologyOn()
-        decimator.Update()
-        return decimator.GetOutput()
+        return self._run_filter(decimator)
     
     def convert_to_triangles(self, mesh):
         """
@@ -102,12 +167,11 @@ class VesselVisualizer(VesselBase):
         返回：
         三角形网格
         """
-        tri_filter = vtk.vtkTriangleFilter()
+        tri_filter = self._get_filter(vtk.vtkTriangleFilter)
         tri_filter.SetInputData(mesh)
         tri_filter.PassLinesOff()
         tri_filter.PassVertsOff()
-        tri_filter.Update()
-        return tri_filter.GetOutput()
+        return self._run_filter(tri_filter)
     
     def save_as_stl(self, polydata, filename):
         """
@@ -117,10 +181,9 @@ class VesselVisualizer(VesselBase):
         polydata: 网格数据
         filename: 输出文件名
         """
-        stl_writer = vtk.vtkSTLWriter()
-        stl_writer.SetFileName(filename)
-        stl_writer.SetInputData(polydata)
-        stl_writer.Write()
+        # 取出三角形后按二进制STL写出，比 vtkSTLWriter 默认的ASCII格式小且快
+        vertices, triangles = self.polydata_to_numpy(polydata)
+        self.save_stl(filename, vertices, triangles)
     
     def create_tube(self, points, max_radius=0.1, min_radius=0.1, k=0.6):
         """
@@ -135,18 +198,16 @@ class VesselVisualizer(VesselBase):
         返回：
         管状网格
         """
-        # 创建点数据
+        # 创建点数据（与 vtkPoints 默认一致使用float32），整块拷贝到vtk数组
+        points_np = np.ascontiguousarray(points, dtype=np.float32)
+        n = len(points_np)
         points_vtk = vtk.vtkPoints()
-        for p in points:
-            points_vtk.InsertNextPoint(p)
+        points_vtk.SetData(numpy_support.numpy_to_vtk(points_np, deep=True))
         
-        # 创建线段
+        # 创建线段：一条依次经过所有点的折线
         lines = vtk.vtkCellArray()
-        line = vtk.vtkPolyLine()
-        line.GetPointIds().SetNumberOfIds(len(points))
-        for i, _ in enumerate(points):
-            line.GetPointIds().SetId(i, i)
-        lines.InsertNextCell(line)
+        lines.SetData(numpy_support.numpy_to_vtkIdTypeArray(np.array([0, n], dtype=np.int64), deep=True),
+                      numpy_support.numpy_to_vtkIdTypeArray(np.arange(n, dtype=np.int64), deep=True))
         
         # 创建PolyData
         poly_data = vtk.vtkPolyData()
@@ -154,29 +215,57 @@ class VesselVisualizer(VesselBase):
         poly_data.SetLines(lines)
         
         # 使用管道过滤器
-        tube_filter = vtk.vtkTubeFilter()
+        tube_filter = self._get_filter(vtk.vtkTubeFilter)
         tube_filter.SetVaryRadiusToVaryRadiusByAbsoluteScalar()
         
-        # 创建半径变化数组
-        radii = vtk.vtkFloatArray()
-        radii.SetNumberOfValues(poly_data.GetNumberOfPoints())
-        for i in range(poly_data.GetNumberOfPoints()):
-            radius = self._linear_interpolation(
-                i, min_radius, max_radius, 
-                poly_data.GetNumberOfPoints(), k
-            )
-            radii.SetValue(i, radius)
+        # 创建半径变化数组，一次计算所有点的半径
+        radii_np = self._lerp_radii(n, min_radius, max_radius, k)
+        radii = numpy_support.numpy_to_vtk(radii_np, deep=True, array_type=vtk.VTK_FLOAT)
         
         poly_data.GetPointData().SetScalars(radii)
         
         tube_filter.SetInputData(poly_data)
         tube_filter.SetNumberOfSides(30)
         tube_filter.CappingOn()
-        tube_filter.Update()
         
-        return tube_filter.GetOutput()
+        return self._run_filter(tube_filter)
     
-    def _linear_interpolation(self, t, eta_min, eta_max, T_max, k=0.6):
+    @staticmethod
+    def _lerp_radii(n, eta_min, eta_max, k=0.6):
+        """
+        一次计算中心线上全部 n 个点的半径，与逐点调用 _linear_interpolation 结果一致
+        
+        参数：
+        n: 点数
+        eta_min: 最小值
+        eta_max: 最大值
+        k: 插值系数
+        
+        返回：
+        float32 半径数组
+        """
+        t = np.arange(n) / (n - 1)
+        return (eta_min + (eta_max - eta_min) * t * k).astype(np.float32)
+    
+    @staticmethod
+    def _nearest_index(line, point):
+        """
+        在中心线上查找离给定点最近的点
+        
+        参数：
+        line: 中心线点集 (N, 3)，已是float64数组时不复制
+        point: 查询点
+        
+        返回：
+        最近点的下标
+        """
+        diff = np.asarray(line, dtype=np.float64) - point
+        # 差值原地平方后按行求和，只分配一个 (N, 3) 临时数组
+        np.multiply(diff, diff, out=diff)
+        return diff.sum(axis=1).argmin()
+    
+    @staticmethod
+    def _linear_interpolation(t, eta_min, eta_max, T_max, k=0.6):
         """
         线性插值计算半径
         
@@ -202,11 +291,45 @@ class VesselVisualizer(VesselBase):
         返回：
         合并后的网格
         """
-        append_filter = vtk.vtkAppendPolyData()
+        append_filter = self._get_filter(vtk.vtkAppendPolyData)
         append_filter.AddInputData(mesh1)
         append_filter.AddInputData(mesh2)
-        append_filter.Update()
-        return append_filter.GetOutput()
+        return self._run_filter(append_filter)
+    
+    def merge_many(self, meshes):
+        """
+        一次合并多个网格，每个输入只复制一次，避免两两累加合并的重复复制
+        
+        参数：
+        meshes: 网格列表，合并结果中的点和单元按列表顺序排列
+        
+        返回：
+        合并后的网格；只有一个网格时直接返回该网格
+        """
+        if len(meshes) == 1:
+            return meshes[0]
+        
+        append_filter = self._get_filter(vtk.vtkAppendPolyData)
+        for mesh in meshes:
+            append_filter.AddInputData(mesh)
+        return self._run_filter(append_filter)
+    
+    def merge_points(self, polydata):
+        """
+        合并坐标完全相同的重复顶点（如各管段封口处的顶点），只合并完全重合的点
+        
+        参数：
+        polydata: 输入网格
+        
+        返回：
+        重复顶点合并后的网格
+        """
+        cleaner = self._get_filter(vtk.vtkCleanPolyData)
+        cleaner.SetInputData(polydata)
+        cleaner.PointMergingOn()
+        # 容差为0时只合并完全重合的点，使用精确的点哈希，比按容差查找快
+        cleaner.SetTolerance(0.0)
+        return self._run_filter(cleaner)
     
     def create_hemisphere(self, radius, center, resolution=30):
         """
@@ -220,15 +343,14 @@ class VesselVisualizer(VesselBase):
         返回：
         半球网格
         """
-        sphere_source = vtk.vtkSphereSource()
+        sphere_source = self._get_filter(vtk.vtkSphereSource)
         sphere_source.SetRadius(radius)
         sphere_source.SetCenter(center)
         sphere_source.SetThetaResolution(resolution)
         sphere_source.SetPhiResolution(resolution)
         sphere_source.SetStartPhi(-180)
         sphere_source.SetEndPhi(180)
-        sphere_source.Update()
-        return sphere_source.GetOutput()
+        return self._run_filter(sphere_source)
     
     def visualize_mesh(self, poly_data):
         """
@@ -259,7 +381,7 @@ class VesselVisualizer(VesselBase):
     def render_vessel_tree(self, blood_tree, layer, main_mesh=None, 
                           last_layer_max_radius=5, last_layer_min_radius=3,
                           last_layers_line=None, previous=None, k=0.6, 
-                          smoothed_big_component=None):
+                          smoothed_big_component=None, max_workers=None):
         """
         渲染血管树
         
@@ -273,6 +395,7 @@ class VesselVisualizer(VesselBase):
         previous: 之前的网格
         k: 半径变化系数
         smoothed_big_component: 平滑的大组件
+        max_workers: 大于1时用线程池并行生成各节点的网格（各节点互不依赖）
         
         返回：
         渲染后的网格
@@ -280,84 +403,130 @@ class VesselVisualizer(VesselBase):
         if len(blood_tree['line']) == 0:
             return
         
-        # 提取点坐标
-        points_line = [p[0] for p in blood_tree['line']]
-        
-        # 处理单点情况
-        if len(points_line) == 1:
-            if smoothed_big_component is not None:
-                mesh = self.decimate_mesh(
-                    self.convert_to_triangles(smoothed_big_component), 0.9
-                )
-            else:
-                mesh = self.create_hemisphere(
-                    last_layer_max_radius * k, points_line[0], 30
-                )
+        # 先序遍历（显式栈代替递归），只计算各节点的中心线和半径，网格生成任务先收集起来，
+        # 生成后一次性合并，避免每个节点都把已合并的整个网格重新复制一遍。
+        # 合并顺序与逐节点 merge_meshes(mesh, previous) 的结果一致：后访问的节点在前
+        jobs = []
+        stack = [(blood_tree, last_layer_max_radius, last_layer_min_radius, last_layers_line)]
+        while stack:
+            node, parent_max_radius, parent_min_radius, parent_line = stack.pop()
+            if len(node['line']) == 0:
+                continue
             
-            if previous is None:
-                previous = mesh
-            else:
-                previous = self.merge_meshes(mesh, previous)
+            # 提取点坐标
+            points_line = self._line_points(node)
             
-            # 递归处理子树
-            for subt in blood_tree['subtree']:
-                previous = self.render_vessel_tree(
-                    subt, layer + 1, main_mesh=1,
-                    last_layer_max_radius=last_layer_max_radius,
-                    last_layer_min_radius=last_layer_min_radius,
-                    last_layers_line=points_line, previous=previous, k=k
-                )
-        else:
-            # 处理多点情况
-            if len(blood_tree['subtree']) == 0:
-                points_line = np.asarray(self.mean_insert(points_line, 2))
-                points_line = self.gaussian_filter_smooth(points_line)
+            # 处理单点情况
+            if len(points_line) == 1:
+                if smoothed_big_component is not None and node is blood_tree:
+                    jobs.append(partial(self._render_big_component, smoothed_big_component))
+                else:
+                    jobs.append(partial(self.create_hemisphere, parent_max_radius * k, points_line[0], 30))
+                max_radius, min_radius = parent_max_radius, parent_min_radius
             else:
+                # 处理多点情况
                 points_line = np.asarray(self.mean_insert(points_line, 2))
                 points_line = self.gaussian_filter_smooth(points_line)
-            
-            # 计算半径
-            if last_layers_line is not None:
-                last_layers_line = np.array(last_layers_line)
-                last_point = np.array(points_line[-1])
-                closest_point = np.argmin(
-                    np.sum((last_layers_line - last_point)**2, axis=1)
-                )
-                max_radius = self._linear_interpolation(
-                    closest_point, last_layer_min_radius, 
-                    last_layer_max_radius, len(last_layers_line), k
-                )
-                min_radius = last_layer_min_radius
-            else:
-                max_radius = last_layer_max_radius
-                min_radius = last_layer_min_radius
-            
-            # 创建管状网格
-            mesh = self.convert_to_triangles(
-                self.create_tube(points_line, max_radius=max_radius, 
-                               min_radius=min_radius, k=k)
-            )
-            
-            if previous is None:
-                if smoothed_big_component is not None:
-                    previous = self.convert_to_triangles(
-                        self.merge_meshes(mesh, smoothed_big_component)
+                
+                # 计算半径
+                if parent_line is not None:
+                    closest_point = self._nearest_index(parent_line, points_line[-1])
+                    max_radius = self._linear_interpolation(
+                        closest_point, parent_min_radius, 
+                        parent_max_radius, len(parent_line), k
                     )
+                    min_radius = parent_min_radius
                 else:
-                    previous = mesh
-            else:
-                previous = self.merge_meshes(mesh, previous)
+                    max_radius = parent_max_radius
+                    min_radius = parent_min_radius
+                
+                # 根节点需要与肝门处的大组件合并
+                if node is blood_tree and previous is None:
+                    big_component = smoothed_big_component
+                else:
+                    big_component = None
+                jobs.append(partial(self._render_tube, points_line, max_radius, min_radius, k, big_component))
             
-            # 递归处理子树
-            for subt in blood_tree['subtree']:
-                previous = self.render_vessel_tree(
-                    subt, layer + 1, main_mesh=1,
-                    last_layer_max_radius=max_radius,
-                    last_layer_min_radius=min_radius,
-                    last_layers_line=points_line, previous=previous, k=k
-                )
-        
-        return previous
+            # 子树逆序入栈，保证按原顺序处理
+            for subt in reversed(node['subtree']):
+                stack.append((subt, max_radius, min_radius, points_line))
+        
+        if max_workers is not None and max_workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pieces = list(executor.map(lambda job: job(), jobs))
+        else:
+            pieces = [job() for job in jobs]
+        
+        if previous is not None:
+            pieces.insert(0, previous)
+        return self.merge_points(self.merge_many(pieces[::-1]))
+    
+    @staticmethod
+    def _line_points(node):
+        """
+        取节点中心线的点坐标数组（每个节点每次渲染只访问一次，不做缓存，也不修改节点）
+        
+        参数：
+        node: 血管树节点
+        
+        返回：
+        C 连续的 float32 数组 (N, 3)
+        """
+        return np.array([p[0] for p in node['line']], dtype=np.float32)
+    
+    def _render_tube(self, points_line, max_radius, min_radius, k, big_component=None):
+        """
+        生成单个节点的三角化管状网格，可选地与肝门处的大组件合并
+        
+        参数：
+        points_line: 平滑后的中心线点集
+        max_radius: 最大半径
+        min_radius: 最小半径
+        k: 半径变化系数
+        big_component: 需要合并的大组件，为None时不合并
+        
+        返回：
+        三角形网格
+        """
+        mesh = self.convert_to_triangles(
+            self.create_tube(points_line, max_radius=max_radius, 
+                           min_radius=min_radius, k=k)
+        )
+        if big_component is not None:
+            # 管状网格已经三角化，合并后只有大组件可能需要转换；
+            # 大组件本身就是三角形网格时不再对合并结果整体重新三角化
+            if not self._is_triangle_mesh(big_component):
+                big_component = self.convert_to_triangles(big_component)
+            mesh = self.merge_meshes(mesh, big_component)
+        return mesh
+    
+    @staticmethod
+    def _is_triangle_mesh(polydata):
+        """
+        判断网格是否只由三角形组成（没有顶点、线、三角带和多边形单元）
+        
+        参数：
+        polydata: 网格数据
+        
+        返回：
+        bool
+        """
+        polys = polydata.GetPolys()
+        return (polydata.GetNumberOfVerts() == 0 and polydata.GetNumberOfLines() == 0 and
+                polydata.GetNumberOfStrips() == 0 and
+                polys.GetNumberOfConnectivityIds() == 3 * polys.GetNumberOfCells())
+    
+    def _render_big_component(self, smoothed_big_component):
+        """
+        单点根节点时，以简化后的肝门大组件作为根节点的网格
+        
+        参数：
+        smoothed_big_component: 平滑的大组件
+        
+        返回：
+        简化后的三角形网格
+        """
+        return self.decimate_mesh(self.convert_to_triangles(smoothed_big_component), 0.9)
     
     def load_stl(self, stl_file):
         """
@@ -369,21 +538,49 @@ class VesselVisualizer(VesselBase):
         返回：
         顶点数组
         """
-        stl_mesh = mesh.Mesh.from_file(stl_file)
+        # 只需要顶点坐标：不重新计算法向，ASCII文件使用numpy-stl的C扩展解析
+        stl_mesh = mesh.Mesh.from_file(stl_file, calculate_normals=False, speedups=True)
         return stl_mesh.vectors.reshape(-1, 3)
     
+    def polydata_to_numpy(self, polydata):
+        """
+        取出网格的顶点坐标和三角形顶点索引
+        
+        参数：
+        polydata: 网格数据，含三角带或多边形时先转换为三角形
+        
+        返回：
+        tuple: (顶点数组 (N, 3), 三角形索引数组 (M, 3))
+        """
+        polys = polydata.GetPolys()
+        if (polydata.GetNumberOfStrips() > 0 or
+                polys.GetNumberOfConnectivityIds() != 3 * polys.GetNumberOfCells()):
+            polydata = self.convert_to_triangles(polydata)
+            polys = polydata.GetPolys()
+        
+        if polydata.GetNumberOfPoints() == 0:
+            return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+        vertices = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+        triangles = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3)
+        return vertices, triangles
+    
     def save_stl(self, stl_file, vertices, faces):
         """
-        保存STL文件
+        保存为二进制STL文件
         
         参数：
         stl_file: 输出文件路径
-        vertices: 顶点数组
-        faces: 面数组
-        """
-        new_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-        new_mesh.vectors = faces
-        new_mesh.save(stl_file)
+        vertices: 顶点数组 (N, 3)
+        faces: 三角形顶点索引 (M, 3)，或已展开的三角形坐标 (M, 3, 3)
+        """
+        faces = np.asarray(faces)
+        new_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype), calculate_normals=False)
+        # 按索引从顶点数组一次性取值，直接写入网格的三角形缓冲区；法向在保存时计算
+        if faces.ndim == 2:
+            np.take(np.asarray(vertices, dtype=np.float32), faces, axis=0, out=new_mesh.vectors)
+        else:
+            new_mesh.vectors[:] = faces
+        new_mesh.save(stl_file, mode=Mode.BINARY)
     
     def voxel_to_physical_coordinates(self, zoom_factors, voxel_coords, 
                                     spacing, origin, direction):
@@ -398,7 +595,7 @@ class VesselVisualizer(VesselBase):
         direction: 方向矩阵
         
         返回：
-        物理坐标
+        物理坐标，float32 数组 (N, 3)
         """
         spacing = np.array([
             spacing[0] / zoom_factors[0],
@@ -406,41 +603,45 @@ class VesselVisualizer(VesselBase):
             spacing[2]
         ])
         
-        physical_coords = (np.dot(direction, voxel_coords.T * spacing[:, None]) + 
-                          origin[:, None])
-        return physical_coords.T
+        # direction @ (v * spacing) + origin：间距先并入 3x3 矩阵，每行一个顶点做一次矩阵乘法，
+        # 直接得到 C 连续的 (N, 3) 结果，原点原地加上，不再生成缩放和转置的中间数组。
+        # 顶点来自vtk且最终写入STL，都是float32，全程用float32计算，内存带宽减半
+        transform = (np.asarray(direction, dtype=np.float64) * spacing).T.astype(np.float32)
+        voxel_coords = np.asarray(voxel_coords, dtype=np.float32)
+        physical_coords = np.matmul(voxel_coords, transform, out=np.empty(voxel_coords.shape, dtype=np.float32))
+        physical_coords += np.asarray(origin, dtype=np.float32)
+        return physical_coords
     
     def process_and_save_mesh(self, mesh, tmp_path, target_path, spacing, 
-                            origin, direction, zoom_factors):
+                            origin, direction, zoom_factors, save_tmp=False):
         """
         处理并保存网格，包括简化、平滑和坐标转换
         
         参数：
         mesh: 输入网格
-        tmp_path: 临时文件路径
+        tmp_path: 临时文件路径，仅在 save_tmp 为True时写出
         target_path: 目标文件路径
         spacing: 像素间距
         origin: 原点
         direction: 方向矩阵
         zoom_factors: 缩放因子
+        save_tmp: 是否把未处理的网格另存到 tmp_path 以便调试，后续处理不依赖该文件
         """
-        # 保存临时文件
-        self.save_as_stl(mesh, tmp_path)
+        if save_tmp:
+            self.save_as_stl(mesh, tmp_path)
         
         # 简化和平滑
         simplified_mesh = self.decimate_mesh(
-            self.smooth_mesh(mesh, 15, 0.5), 0.99
+            self.smooth_mesh(mesh, 15), 0.99
         )
         
-        # 保存处理后的文件
-        self.save_as_stl(simplified_mesh, target_path)
+        # 直接从内存中的网格取出顶点和三角形，不再先写出STL再读回
+        voxel_coords, triangles = self.polydata_to_numpy(simplified_mesh)
         
-        # 坐标转换
-        voxel_coords = self.load_stl(target_path)
+        # 坐标转换（每个顶点只转换一次）
         physical_coords = self.voxel_to_physical_coordinates(
             zoom_factors, voxel_coords, spacing, origin, direction
         )
         
-        # 重新保存转换后的文件
-        faces = physical_coords.reshape(-1, 3, 3)
-        self.save_stl(target_path, physical_coords, faces) 
\ No newline at end of file
+        # 保存转换后的文件
+        self.save_stl(target_path, physical_coords, triangles) 
\ No newline at end of file